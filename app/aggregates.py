@@ -0,0 +1,301 @@
+"""
+Running aggregates over the entries table.
+
+EntryStore.create folds every new entry in as it is written, so the
+summary, per-handle average and correlation endpoints are answered from a
+few counters instead of re-reading the data. Rows written by anyone else
+(scripts, other processes) are picked up on the next read by folding in
+the entries after the last id seen; entries are append-only, so nothing
+is ever counted twice. The same pass maintains per-day and per-hour
+rollups (TimeRollups) for the time-series endpoints.
+"""
+import bisect
+import math
+import threading
+from array import array
+from collections import Counter
+from datetime import timedelta
+
+from .insights import correlation_report
+
+# fields correlated against mood, as in insights.correlations()
+EXTENDED = ('sleep_hours', 'appetite', 'concentration')
+
+# fields rolled up per time bucket; each gets count, sum, min and max
+ROLLUP_FIELDS = ('mood',) + EXTENDED
+GRANULARITIES = ('day', 'hour')
+
+
+class _Pair:
+    """Co-moments of mood vs one field over rows that have both.
+
+    Welford-style updates: the centred cross-product sums stay accurate
+    however many rows are folded in, unlike raw sum/sum-of-squares.
+    """
+
+    __slots__ = ('n', 'mean_x', 'mean_y', 'm2x', 'm2y', 'cxy')
+
+    def __init__(self):
+        self.n = 0
+        self.mean_x = self.mean_y = self.m2x = self.m2y = self.cxy = 0.0
+
+    def add(self, x, y):
+        self.n += 1
+        dx = x - self.mean_x
+        self.mean_x += dx / self.n
+        dy = y - self.mean_y
+        self.mean_y += dy / self.n
+        self.m2x += dx * (x - self.mean_x)
+        self.m2y += dy * (y - self.mean_y)
+        self.cxy += dx * (y - self.mean_y)
+
+    def pearson(self):
+        if self.n < 2 or self.m2x <= 0 or self.m2y <= 0:
+            return None
+        return self.cxy / math.sqrt(self.m2x * self.m2y)
+
+
+def _bucket_start(dt, granularity):
+    if granularity == 'hour':
+        return dt.replace(minute=0, second=0, microsecond=0)
+    return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class TimeRollups:
+    """Count/sum/min/max per field for every day and hour that has entries,
+    overall (handle None) and per handle.
+
+    Each series keeps its bucket starts sorted, so a range read bisects
+    to the first bucket and touches only the ones inside the range.
+    """
+
+    def __init__(self):
+        # (granularity, handle) -> sorted bucket starts / {start: stats}
+        self._starts = {}
+        self._stats = {}
+
+    def fold(self, e):
+        values = [e.mood] + [getattr(e, f) for f in EXTENDED]
+        for granularity in GRANULARITIES:
+            start = _bucket_start(e.created, granularity)
+            for handle in (None, e.handle):
+                self._add((granularity, handle), start, values)
+
+    def _add(self, series, start, values):
+        stats = self._stats.get(series)
+        if stats is None:
+            stats = self._stats[series] = {}
+            self._starts[series] = []
+        b = stats.get(start)
+        if b is None:
+            # [n, sum, min, max] for each field, flat
+            b = stats[start] = array('d', [0.0, 0.0, math.inf, -math.inf] * len(ROLLUP_FIELDS))
+            starts = self._starts[series]
+            if not starts or start > starts[-1]:
+                starts.append(start)
+            else:
+                bisect.insort(starts, start)
+        for k, v in enumerate(values):
+            if v is None:
+                continue
+            j = 4 * k
+            b[j] += 1
+            b[j + 1] += v
+            if v < b[j + 2]:
+                b[j + 2] = v
+            if v > b[j + 3]:
+                b[j + 3] = v
+
+    def series(self, granularity='day', start=None, end=None, handle=None):
+        """[(bucket start, {field: {count, sum, mean, min, max}})] for the
+        buckets whose start lies in [start, end], oldest first."""
+        key = (granularity, handle)
+        starts = self._starts.get(key)
+        if not starts:
+            return []
+        stats = self._stats[key]
+        lo = bisect.bisect_left(starts, _bucket_start(start, granularity)) if start is not None else 0
+        hi = bisect.bisect_right(starts, end) if end is not None else len(starts)
+        out = []
+        for s in starts[lo:hi]:
+            b = stats[s]
+            fields = {}
+            for k, f in enumerate(ROLLUP_FIELDS):
+                n, total, low, high = b[4 * k:4 * k + 4]
+                n = int(n)
+                fields[f] = {
+                    'count': n,
+                    'sum': total,
+                    'mean': total / n if n else None,
+                    'min': low if n else None,
+                    'max': high if n else None,
+                }
+            out.append((s, fields))
+        return out
+
+    def mood_means(self, granularity='day', days=None):
+        """[(bucket start, mean mood)] overall, limited to buckets within
+        ``days`` of the newest one (exclusive, like pandas' ``last``)."""
+        starts = self._starts.get((granularity, None))
+        if not starts:
+            return []
+        stats = self._stats[(granularity, None)]
+        lo = bisect.bisect_right(starts, starts[-1] - timedelta(days=days)) if days is not None else 0
+        return [(s, stats[s][1] / stats[s][0]) for s in starts[lo:]]
+
+
+class RunningAggregates:
+    """Per-handle mood count/sum/sum-of-squares, global mood histogram and
+    mood-vs-field cross products, kept current on write."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._version = None
+        self._reset()
+
+    def _reset(self):
+        self.count = 0
+        self.last_id = 0
+        # (id, created, mood) of the row behind last_id
+        self._last = None
+        self.by_handle = {}
+        self.histogram = Counter()
+        self.pairs = {f: _Pair() for f in EXTENDED}
+        self.rollups = TimeRollups()
+
+    def _fold(self, e):
+        self.count += 1
+        if e.id >= self.last_id:
+            self.last_id = e.id
+            self._last = (e.id, e.created, e.mood)
+        mood = e.mood
+        stats = self.by_handle.get(e.handle)
+        if stats is None:
+            stats = self.by_handle[e.handle] = [0, 0, 0]
+        # mood is an int, so these sums stay exact
+        stats[0] += 1
+        stats[1] += mood
+        stats[2] += mood * mood
+        self.histogram[mood] += 1
+        for f in EXTENDED:
+            v = getattr(e, f)
+            if v is not None:
+                self.pairs[f].add(mood, v)
+        self.rollups.fold(e)
+
+    def _still_matches(self):
+        # a rewritten source (migration, restore, manual edit) no longer has our last row
+        if self._last is None:
+            return True
+        rec = self.backend.get_many([self.last_id])[0]
+        return rec is not None and (rec.id, rec.created, rec.mood) == self._last
+
+    def _catch_up(self):
+        version = self.backend.version()
+        if self._loaded and version == self._version:
+            return
+        if not self._still_matches():
+            self._reset()
+        for e in self.backend.iter_entries(after_id=self.last_id or None):
+            self._fold(e)
+        self._loaded = True
+        self._version = version
+
+    def add(self, e):
+        """Fold in an entry we just wrote.
+
+        Only the next id in sequence is folded here; anything out of order
+        (a concurrent writer got in first) is left to the next catch-up.
+        """
+        with self._lock:
+            if self._loaded and e.id == self.last_id + 1:
+                self._fold(e)
+
+    def rebuild(self):
+        """Fold everything again from scratch."""
+        with self._lock:
+            self._reset()
+            self._loaded = False
+            self._catch_up()
+
+    def summary(self):
+        """Same payload as insights.summary()."""
+        with self._lock:
+            self._catch_up()
+            n = self.count
+            if n == 0:
+                return {'count': 0}
+            total = sum(s[1] for s in self.by_handle.values())
+            total_sq = sum(s[2] for s in self.by_handle.values())
+            ordered = sorted(self.histogram.items())
+            mood_stats = {
+                'count': float(n),
+                'mean': total / n,
+                # exact integer numerator, one rounding
+                'std': math.sqrt((n * total_sq - total * total) / (n * (n - 1))) if n > 1 else None,
+                'min': float(ordered[0][0]),
+                '25%': _quantile(ordered, n, 0.25),
+                '50%': _quantile(ordered, n, 0.5),
+                '75%': _quantile(ordered, n, 0.75),
+                'max': float(ordered[-1][0]),
+            }
+            return {'count': n, 'mood_stats': mood_stats}
+
+    def avg_by(self):
+        """Same payload as insights.avg_by(): mean mood per handle, highest first."""
+        with self._lock:
+            self._catch_up()
+            # blank handles read as NaN in pandas and drop out of its groupby
+            means = [(str(h), s[1] / s[0]) for h, s in sorted(self.by_handle.items(), key=lambda kv: str(kv[0])) if h]
+        means.sort(key=lambda kv: kv[1], reverse=True)
+        return dict(means)
+
+    def correlations(self):
+        """Same payload as insights.correlations()."""
+        with self._lock:
+            self._catch_up()
+            if self.count == 0:
+                return {'error': 'No data available'}
+            correlations_dict = {}
+            for f in EXTENDED:
+                r = self.pairs[f].pearson()
+                if r is not None:
+                    correlations_dict[f'mood_vs_{f}'] = round(max(-1.0, min(1.0, r)), 3)
+            return correlation_report(correlations_dict, self.count)
+
+    def timeseries(self, granularity='day', start=None, end=None, handle=None):
+        """Rolled-up buckets in [start, end]; see TimeRollups.series()."""
+        if granularity not in GRANULARITIES:
+            raise ValueError(f'granularity must be one of {", ".join(GRANULARITIES)}')
+        with self._lock:
+            self._catch_up()
+            return self.rollups.series(granularity, start, end, handle)
+
+    def daily_mood(self, days=90):
+        """(day, mean mood) over the last ``days`` days, counted back from
+        the newest entry -- the series behind the ts plot."""
+        with self._lock:
+            self._catch_up()
+            return self.rollups.mood_means('day', days)
+
+
+def _quantile(ordered, n, q):
+    # linear interpolation between order statistics, as pandas/numpy do;
+    # ``ordered`` is the sorted (value, count) histogram
+    pos = q * (n - 1)
+    lo = int(math.floor(pos))
+    hi = min(lo + 1, n - 1)
+    v_lo = _kth(ordered, lo)
+    v_hi = _kth(ordered, hi)
+    return float(v_lo + (v_hi - v_lo) * (pos - lo))
+
+
+def _kth(ordered, k):
+    seen = 0
+    for value, c in ordered:
+        seen += c
+        if k < seen:
+            return value
+    return ordered[-1][0]
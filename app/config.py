@@ -0,0 +1,108 @@
+"""
+Runtime settings for MoodKeeper.
+Every value can be overridden with a MOODKEEPER_* environment variable.
+"""
+import os
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def _env(name: str, default: str) -> str:
+    return os.environ.get(f'MOODKEEPER_{name}', default)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(_env(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    return _env(name, '1' if default else '0').strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(_env(name, str(default)))
+    except ValueError:
+        return default
+
+
+# `python main.py` launch settings. 'development' is one process with
+# auto-reload; 'production' runs WORKERS processes without the reloader
+SERVER_MODE = _env('SERVER_MODE', 'development').strip().lower()
+HOST = _env('HOST', '127.0.0.1')
+PORT = _env_int('PORT', 8001)
+WORKERS = _env_int('WORKERS', os.cpu_count() or 1)
+# seconds an idle keep-alive connection stays open, pending connections the
+# listening socket queues, and seconds in-flight requests get to finish on
+# shutdown before they are cancelled
+KEEPALIVE = _env_int('KEEPALIVE', 5)
+BACKLOG = _env_int('BACKLOG', 2048)
+GRACEFUL_TIMEOUT = _env_int('GRACEFUL_TIMEOUT', 30)
+
+# Directory holding accounts.csv/entries.csv and the files derived from them
+DATA_DIR = _env('DATA_DIR', os.path.join(ROOT, 'data'))
+
+# Storage engine: 'csv' (files under DATA_DIR) or 'sqlite'
+STORAGE_BACKEND = _env('STORAGE', 'csv').strip().lower()
+SQLITE_PATH = _env('SQLITE_PATH', os.path.join(DATA_DIR, 'moodkeeper.db'))
+
+# Serve entry listings from a memory-mapped, column-per-file copy of the
+# entries (app/entry_table.py) kept under ENTRY_TABLE_DIR
+ENTRY_TABLE = _env_bool('ENTRY_TABLE', False)
+ENTRY_TABLE_DIR = _env('ENTRY_TABLE_DIR', os.path.join(DATA_DIR, 'entries.table'))
+
+# Group commit for CSV entry appends: seconds the writer waits to gather a
+# batch when several writers are queued (a lone write goes out at once),
+# the most rows written at once, and whether each batch is fsync'ed before
+# the writers are answered
+ENTRY_FLUSH_INTERVAL = _env_float('ENTRY_FLUSH_INTERVAL', 0.002)
+ENTRY_MAX_BATCH = _env_int('ENTRY_MAX_BATCH', 256)
+ENTRY_FSYNC = _env_bool('ENTRY_FSYNC', False)
+
+# Most entries, and most body bytes, accepted by one POST /api/entries/bulk
+ENTRY_BULK_MAX = _env_int('ENTRY_BULK_MAX', 10000)
+ENTRY_BULK_MAX_BYTES = _env_int('ENTRY_BULK_MAX_BYTES', 16 * 1024 * 1024)
+
+# Seconds between rewrites of the columnar entries snapshot read by the
+# analytics; 0 turns the background compaction off
+SNAPSHOT_INTERVAL = _env_float('SNAPSHOT_INTERVAL', 300.0)
+
+# Import pandas/numpy/matplotlib/seaborn in the background at start-up
+# instead of on the first analytics request (app/lazy.py)
+WARM_UP = _env_bool('WARM_UP', False)
+
+# Per-route request metrics (served at /metrics in the Prometheus format)
+METRICS = _env_bool('METRICS', True)
+
+# Sampling profiles of single requests: a request carrying PROFILE_TOKEN
+# (X-Profile header or ?profile=) is profiled when PROFILING is on, and
+# its collapsed stacks are written under PROFILE_DIR; one sample every
+# PROFILE_INTERVAL seconds. Only the newest PROFILE_KEEP files are kept.
+PROFILING = _env_bool('PROFILING', False)
+PROFILE_TOKEN = _env('PROFILE_TOKEN', '')
+PROFILE_DIR = _env('PROFILE_DIR', os.path.join(DATA_DIR, 'profiles'))
+PROFILE_INTERVAL = _env_float('PROFILE_INTERVAL', 0.001)
+PROFILE_KEEP = _env_int('PROFILE_KEEP', 100)
+
+# Rendered PNGs kept by /api/insights/plot/{plot_name}
+PLOT_CACHE_SIZE = _env_int('PLOT_CACHE_SIZE', 32)
+
+# Worker processes that render plots, renders allowed to wait for one,
+# and seconds a single render may take
+PLOT_WORKERS = _env_int('PLOT_WORKERS', 2)
+PLOT_QUEUE = _env_int('PLOT_QUEUE', 8)
+PLOT_TIMEOUT = _env_float('PLOT_TIMEOUT', 20.0)
+
+# Verified bearer tokens remembered by the API (each until its own expiry)
+TOKEN_CACHE_SIZE = _env_int('TOKEN_CACHE_SIZE', 1024)
+
+# Threads that run PBKDF2 and hashing calls allowed to wait for one
+HASH_WORKERS = _env_int('HASH_WORKERS', 2)
+HASH_QUEUE = _env_int('HASH_QUEUE', 16)
+
+# Failed logins allowed per handle within the window (seconds); 0 disables
+LOGIN_MAX_FAILURES = _env_int('LOGIN_MAX_FAILURES', 5)
+LOGIN_FAILURE_WINDOW = _env_float('LOGIN_FAILURE_WINDOW', 300.0)
@@ -0,0 +1,490 @@
+"""
+Memory-mapped, column-per-file copy of the entries table.
+
+Opt-in with MOODKEEPER_ENTRY_TABLE=1. Every numeric field lives in its
+own fixed-width file under data/entries.table/ and is read through mmap,
+so a full scan walks the mapped pages instead of building one
+EntryRecord (and one datetime) per row. Handles and comments live in
+side tables their columns index into: handles are interned (each
+distinct one stored once), comments are appended as they come. Rows
+come back as EntryView objects that read their fields from the columns
+on access.
+
+The CSV (or SQLite) store stays the source of truth; the table follows
+it by appending whatever was written after its last id, the same way the
+running aggregates catch up.
+
+Mapped files are never shrunk: old snapshots (and other workers) may
+still be reading them, and touching a page past the end of a truncated
+file kills the process with SIGBUS. How many rows and strings exist is
+committed in table.json after each append; bytes past that (a torn
+append) are ignored and overwritten by the next one. A rebuild swaps in
+new, empty files with os.replace, so old snapshots keep the old inodes.
+"""
+import bisect
+import json
+import mmap
+import os
+from array import array
+from collections.abc import Sequence
+from datetime import datetime, timedelta
+
+from .storage import EntryRecord, _FileLock
+
+# (field, array typecode); scores and indexes use -1 for "missing",
+# sleep_hours uses NaN. created is microseconds since 1970-01-01, naive
+# like the stored timestamps, so it round-trips exactly.
+COLUMNS = (
+    ('account_id', 'q'),
+    ('handle', 'i'),
+    ('mood', 'b'),
+    ('appetite', 'b'),
+    ('concentration', 'b'),
+    ('sleep_hours', 'd'),
+    ('created', 'q'),
+    ('comment', 'i'),
+    # written last: a row exists once its id does
+    ('id', 'q'),
+)
+
+EPOCH = datetime(1970, 1, 1)
+_MICRO = timedelta(microseconds=1)
+
+# rows appended per write while catching up
+_CHUNK = 10000
+
+
+class _Column:
+    """One fixed-width column file, read through a shared mmap."""
+
+    def __init__(self, path, typecode):
+        self.path = path
+        self.typecode = typecode
+        self.itemsize = array(typecode).itemsize
+        if not os.path.exists(path):
+            open(path, 'wb').close()
+
+    def count(self):
+        return os.path.getsize(self.path) // self.itemsize
+
+    def write_at(self, row, values):
+        # over whatever a torn append left past the committed rows
+        with open(self.path, 'r+b') as f:
+            f.seek(row * self.itemsize)
+            array(self.typecode, values).tofile(f)
+
+    def replace(self, values=()):
+        # a new file under the same name; mappings of the old one stay valid
+        tmp = self.path + '.new'
+        with open(tmp, 'wb') as f:
+            array(self.typecode, values).tofile(f)
+        os.replace(tmp, self.path)
+
+    def view(self, rows):
+        # zero-copy: a typed memoryview straight over the mapped file.
+        # Old views stay valid after a remap; the mmap lives as long as they do.
+        if rows == 0:
+            return memoryview(array(self.typecode))
+        with open(self.path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), rows * self.itemsize, access=mmap.ACCESS_READ)
+        return memoryview(mm).cast(self.typecode)
+
+
+class _StringsView:
+    # the strings as mapped at one moment, kept by a snapshot
+    __slots__ = ('_offs', '_blob')
+
+    def __init__(self, offs, blob):
+        self._offs = offs
+        self._blob = blob
+
+    def __len__(self):
+        return len(self._offs) - 1
+
+    def get(self, i):
+        if i < 0:
+            return None
+        return str(self._blob[self._offs[i]:self._offs[i + 1]], 'utf-8')
+
+
+class _Strings:
+    """Strings in a UTF-8 blob plus an int64 offsets column.
+
+    String ``i`` spans offsets[i]..offsets[i+1] of the blob. intern()
+    stores each distinct value once (handles); add() just appends
+    (free-text comments, which rarely repeat).
+    """
+
+    def __init__(self, directory, name):
+        self.blob_path = os.path.join(directory, name + '.bin')
+        self.offsets = _Column(os.path.join(directory, name + '.idx'), 'q')
+        if self.offsets.count() == 0:
+            self.offsets.replace([0])
+        if not os.path.exists(self.blob_path):
+            open(self.blob_path, 'wb').close()
+        # value -> index for intern(), covering strings 0.._known-1
+        self._ids = None
+        self._known = 0
+        self._ino = None
+        self._remap()
+
+    def _remap(self, count=None):
+        # ``count`` committed strings; None (a table from before table.json):
+        # whatever the offsets file holds
+        if count is None:
+            count = self.offsets.count() - 1
+        self._offs = self.offsets.view(count + 1)
+        end = self._offs[count]
+        if end:
+            with open(self.blob_path, 'rb') as f:
+                self._blob = memoryview(mmap.mmap(f.fileno(), end, access=mmap.ACCESS_READ))
+        else:
+            self._blob = memoryview(b'')
+
+    def __len__(self):
+        return len(self._offs) - 1
+
+    def get(self, i):
+        if i < 0:
+            return None
+        return str(self._blob[self._offs[i]:self._offs[i + 1]], 'utf-8')
+
+    def view(self):
+        return _StringsView(self._offs, self._blob)
+
+    def find(self, value):
+        """Index of ``value`` if it is already interned, else None."""
+        return self._index().get(value)
+
+    def _index(self):
+        # built on first use only; readers never pay for it. Afterwards only
+        # strings appended since (by another worker) are added to it.
+        if self._ids is None:
+            self._ids, self._known = {}, 0
+        for i in range(self._known, len(self)):
+            self._ids.setdefault(self.get(i), i)
+        self._known = len(self)
+        return self._ids
+
+    def _write(self, fresh):
+        # append encoded strings; returns the index of the first one
+        first = len(self)
+        if fresh:
+            start = end = self._offs[first]
+            ends = []
+            for data in fresh:
+                end += len(data)
+                ends.append(end)
+            with open(self.blob_path, 'r+b') as f:
+                f.seek(start)
+                f.write(b''.join(fresh))
+            self.offsets.write_at(first + 1, ends)
+            self._remap(first + len(fresh))
+        return first
+
+    def intern(self, values):
+        """Indexes for ``values`` (None -> -1), appending the new ones."""
+        ids = self._index()
+        out, fresh = [], []
+        n = len(self)
+        for v in values:
+            if v is None:
+                out.append(-1)
+                continue
+            i = ids.get(v)
+            if i is None:
+                fresh.append(v.encode('utf-8'))
+                i = ids[v] = n
+                n += 1
+            out.append(i)
+        self._write(fresh)
+        self._known = len(self)
+        return out
+
+    def add(self, values):
+        """Append every value (None -> -1) and return their indexes."""
+        fresh = [v.encode('utf-8') for v in values if v is not None]
+        i = self._write(fresh)
+        out = []
+        for v in values:
+            if v is None:
+                out.append(-1)
+            else:
+                out.append(i)
+                i += 1
+        return out
+
+    def refresh(self, count=None):
+        """Remap to ``count`` committed strings; the intern index survives
+        unless the files were replaced or it covers uncommitted strings."""
+        ino = os.stat(self.offsets.path).st_ino
+        self._remap(count)
+        if ino != self._ino or len(self) < self._known:
+            self._ids, self._known = None, 0
+        self._ino = ino
+
+    def clear(self):
+        self.offsets.replace([0])
+        tmp = self.blob_path + '.new'
+        open(tmp, 'wb').close()
+        os.replace(tmp, self.blob_path)
+
+
+class EntryView:
+    """One row of an EntryTable; fields are read from the columns on access."""
+
+    __slots__ = ('_t', '_i')
+
+    def __init__(self, snap, i):
+        self._t = snap
+        self._i = i
+
+    @property
+    def id(self):
+        return self._t.cols['id'][self._i]
+
+    @property
+    def account_id(self):
+        return self._t.cols['account_id'][self._i]
+
+    @property
+    def handle(self):
+        return self._t.handles.get(self._t.cols['handle'][self._i])
+
+    @property
+    def mood(self):
+        return self._t.cols['mood'][self._i]
+
+    @property
+    def comment(self):
+        return self._t.comments.get(self._t.cols['comment'][self._i])
+
+    @property
+    def sleep_hours(self):
+        v = self._t.cols['sleep_hours'][self._i]
+        return None if v != v else v
+
+    @property
+    def appetite(self):
+        v = self._t.cols['appetite'][self._i]
+        return None if v < 0 else v
+
+    @property
+    def concentration(self):
+        v = self._t.cols['concentration'][self._i]
+        return None if v < 0 else v
+
+    @property
+    def created(self):
+        return EPOCH + self._t.cols['created'][self._i] * _MICRO
+
+    def to_record(self):
+        return EntryRecord(id=self.id, account_id=self.account_id, handle=self.handle, mood=self.mood,
+                           comment=self.comment, sleep_hours=self.sleep_hours, appetite=self.appetite,
+                           concentration=self.concentration, created=self.created)
+
+    def __repr__(self):
+        return f'EntryView({self.to_record()!r})'
+
+
+class _Snapshot:
+    # the columns as mapped at one moment; a scan keeps using them even if
+    # the table grows meanwhile
+    __slots__ = ('cols', 'handles', 'comments', 'rows')
+
+    def __init__(self, cols, handles, comments, rows):
+        self.cols = cols
+        self.handles = handles
+        self.comments = comments
+        self.rows = rows
+
+
+class _Rows(Sequence):
+    """Read-only sequence of EntryViews over one snapshot of the table."""
+
+    def __init__(self, snap, start=0, stop=None):
+        self._snap = snap
+        self._range = range(start, snap.rows if stop is None else stop)
+
+    def __len__(self):
+        return len(self._range)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            r = self._range[i]
+            if r.step != 1:
+                return [EntryView(self._snap, j) for j in r]
+            return _Rows(self._snap, r.start, r.stop)
+        return EntryView(self._snap, self._range[i])
+
+    def __iter__(self):
+        snap = self._snap
+        for i in self._range:
+            yield EntryView(snap, i)
+
+
+class EntryTable:
+    """Column-per-file mirror of an EntryBackend under ``directory``."""
+
+    def __init__(self, backend, directory):
+        self.backend = backend
+        self.directory = directory
+        self._version = None
+        os.makedirs(directory, exist_ok=True)
+        # every server worker mirrors into the same files; one at a time
+        self._lock = _FileLock(os.path.join(directory, '.lock'))
+        with self._lock:
+            self._columns = {name: _Column(os.path.join(directory, name + '.col'), code) for name, code in COLUMNS}
+            self._handles = _Strings(directory, 'handles')
+            self._comments = _Strings(directory, 'comments')
+            self._meta_path = os.path.join(directory, 'table.json')
+            self._rows = 0
+            self._snap = None
+            self._reopen()
+
+    def _read_meta(self):
+        try:
+            with open(self._meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, rows, handles, comments):
+        # what readers may map from now on; written after the data it counts
+        tmp = self._meta_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'rows': rows, 'handles': handles, 'comments': comments}, f)
+        os.replace(tmp, self._meta_path)
+        self._rows = rows
+
+    def _reopen(self):
+        meta = self._read_meta()
+        if meta is None:
+            # a table from before table.json: the shortest column
+            rows = min(c.count() for c in self._columns.values())
+            self._handles.refresh()
+            self._comments.refresh()
+        else:
+            rows = meta['rows']
+            self._handles.refresh(meta['handles'])
+            self._comments.refresh(meta['comments'])
+        self._rows = rows
+        cols = {name: c.view(rows) for name, c in self._columns.items()}
+        self._snap = _Snapshot(cols, self._handles.view(), self._comments.view(), rows)
+
+    def _clear(self):
+        # committed empty first: a crash halfway leaves an empty table, not
+        # a count pointing past the end of the new files
+        self._write_meta(0, 0, 0)
+        for c in self._columns.values():
+            c.replace()
+        for strings in (self._handles, self._comments):
+            strings.clear()
+
+    def _last_id(self):
+        snap = self._snap
+        return snap.cols['id'][snap.rows - 1] if snap.rows else None
+
+    def _still_matches(self):
+        # a rewritten source (migration, manual edit) no longer has our last row
+        snap = self._snap
+        if not snap.rows:
+            return True
+        last = snap.rows - 1
+        rec = self.backend.get_many([snap.cols['id'][last]])[0]
+        return rec is not None and _micros(rec.created) == snap.cols['created'][last] \
+            and rec.mood == snap.cols['mood'][last]
+
+    def _append(self, records):
+        handles = self._handles.intern([e.handle for e in records])
+        # comments are free text: stored as they come, not looked up
+        comments = self._comments.add([e.comment for e in records])
+        values = {
+            'account_id': [e.account_id for e in records],
+            'handle': handles,
+            'mood': [e.mood for e in records],
+            'appetite': [-1 if e.appetite is None else e.appetite for e in records],
+            'concentration': [-1 if e.concentration is None else e.concentration for e in records],
+            'sleep_hours': [float('nan') if e.sleep_hours is None else e.sleep_hours for e in records],
+            'created': [_micros(e.created) for e in records],
+            'comment': comments,
+            'id': [e.id for e in records],
+        }
+        arrays = {name: array(code, values[name]) for name, code in COLUMNS}
+        for name, _ in COLUMNS:
+            self._columns[name].write_at(self._rows, arrays[name])
+        self._write_meta(self._rows + len(records), len(self._handles), len(self._comments))
+
+    def sync(self):
+        """Append whatever the backend holds past our last id.
+
+        Raises OverflowError when a value does not fit its column (a score
+        outside the int8 range), leaving the table at the last whole chunk.
+        """
+        with self._lock:
+            version = self.backend.version()
+            if self._version is not None and version == self._version:
+                return
+            self._reopen()
+            if not self._still_matches():
+                self._clear()
+                self._reopen()
+            batch = []
+            try:
+                for e in self.backend.iter_entries(after_id=self._last_id()):
+                    batch.append(e)
+                    if len(batch) >= _CHUNK:
+                        self._append(batch)
+                        batch = []
+                if batch:
+                    self._append(batch)
+            finally:
+                self._reopen()
+            self._version = version
+
+    def rows(self):
+        """Every row as a lazy, zero-copy sequence of EntryViews."""
+        self.sync()
+        return _Rows(self._snap)
+
+    def column(self, name):
+        """The raw mapped column, e.g. for vectorised scans (np.frombuffer)."""
+        self.sync()
+        return self._snap.cols[name]
+
+    def query(self, after_id=None, limit=None, handle=None, account_id=None, created_from=None, created_to=None):
+        """Same contract as EntryBackend.iter_entries, scanned over the columns."""
+        self.sync()
+        snap = self._snap
+        if limit is not None and limit <= 0:
+            return
+        cols = snap.cols
+        ids = cols['id']
+        # ids are appended in increasing order, so the cursor is a bisection
+        start = bisect.bisect_right(ids, after_id) if after_id is not None else 0
+        handle_ix = None
+        if handle is not None:
+            handle_ix = self._handles.find(handle)
+            if handle_ix is None:
+                return
+        lo = _micros(created_from) if created_from is not None else None
+        hi = _micros(created_to) if created_to is not None else None
+        handles, accounts, created = cols['handle'], cols['account_id'], cols['created']
+        n = 0
+        for i in range(start, snap.rows):
+            if handle_ix is not None and handles[i] != handle_ix:
+                continue
+            if account_id is not None and accounts[i] != account_id:
+                continue
+            if lo is not None and created[i] < lo:
+                continue
+            if hi is not None and created[i] > hi:
+                continue
+            yield EntryView(snap, i)
+            n += 1
+            if limit is not None and n >= limit:
+                return
+
+
+def _micros(dt):
+    return (dt.replace(tzinfo=None) - EPOCH) // _MICRO
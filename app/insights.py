@@ -1,33 +1,91 @@
 import os
+import hashlib
+import threading
+from collections import OrderedDict
 from datetime import datetime
 from typing import Optional, Dict, Any
 import math
 
-_HAS_PANDAS = True
-try:
-    import pandas as pd
-except Exception:
-    pd = None
-    _HAS_PANDAS = False
-
 from io import BytesIO
+from contextlib import closing
+
+from . import config
+from .lazy import pd, np, available
+from .snapshot import load_entries as _load_snapshot, typed_frame
 
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-ENTRIES = os.path.join(ROOT, 'data', 'entries.csv')
+ENTRIES = os.path.join(config.DATA_DIR, 'entries.csv')
 RECOMMENDATIONS = os.path.join(ROOT, 'data', 'recommendations.csv')
 
 
+def _has_pandas():
+    # imports pandas/numpy on first use (see app/lazy.py)
+    return available('pandas') and available('numpy')
+
+
+_FRAME_LOCK = threading.Lock()
+_FRAME_CACHE = {'key': None, 'df': None}
+_CACHE_STATS = {'hits': 0, 'misses': 0}
+
+
+def _entries_version():
+    """Cheap token that changes whenever the entries data changes."""
+    if config.STORAGE_BACKEND == 'sqlite':
+        paths = (config.SQLITE_PATH, config.SQLITE_PATH + '-wal')
+    else:
+        paths = (ENTRIES,)
+    key = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            key.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            key.append(None)
+    return (config.STORAGE_BACKEND,) + tuple(key)
+
+
+def _parse_entries():
+    # typed, compact columns either way (see snapshot.typed_frame)
+    if config.STORAGE_BACKEND == 'sqlite':
+        import sqlite3
+        if not os.path.exists(config.SQLITE_PATH):
+            return pd.DataFrame()
+        with closing(sqlite3.connect(config.SQLITE_PATH)) as conn:
+            return typed_frame(pd.read_sql_query('SELECT * FROM entries ORDER BY id', conn))
+    # columnar snapshot plus whatever was appended since it was written
+    return _load_snapshot(ENTRIES)
+
+
 def _load_entries():
-    if not _HAS_PANDAS:
+    """
+    Return the entries DataFrame, shared by every caller in the process.
+    The frame is re-parsed only when the underlying file changes; callers
+    must treat it as read-only.
+    """
+    if not _has_pandas():
         return None
-    if not os.path.exists(ENTRIES):
-        return pd.DataFrame()
-    df = pd.read_csv(ENTRIES)
-    if 'created' in df.columns:
-        df['created'] = pd.to_datetime(df['created'], errors='coerce')
-    if 'mood' in df.columns:
-        df['mood'] = pd.to_numeric(df['mood'], errors='coerce')
-    return df
+    with _FRAME_LOCK:
+        # holding the lock while parsing makes concurrent misses share one parse
+        key = _entries_version()
+        if _FRAME_CACHE['df'] is not None and _FRAME_CACHE['key'] == key:
+            _CACHE_STATS['hits'] += 1
+            return _FRAME_CACHE['df']
+        _CACHE_STATS['misses'] += 1
+        df = _parse_entries()
+        _FRAME_CACHE['key'] = key
+        _FRAME_CACHE['df'] = df
+        return df
+
+
+def cache_stats():
+    """Hit/miss counters of the shared entries DataFrame cache."""
+    with _FRAME_LOCK:
+        df = _FRAME_CACHE['df']
+        return {
+            'hits': _CACHE_STATS['hits'],
+            'misses': _CACHE_STATS['misses'],
+            'rows': int(df.shape[0]) if df is not None else 0,
+        }
 
 
 def summary():
@@ -54,7 +112,7 @@ def avg_by(handle_col='handle'):
         return {'error': 'pandas required'}
     if df.empty or handle_col not in df.columns:
         return {}
-    r = df.groupby(handle_col)['mood'].mean().sort_values(ascending=False)
+    r = df.groupby(handle_col, observed=True)['mood'].mean().sort_values(ascending=False)
     out = {}
     for k, v in r.items():
         try:
@@ -149,6 +207,75 @@ def compute_risk_level(composite_score, trend_negative=False):
         return 'BAJO'
 
 
+def _as_float_array(values):
+    if hasattr(values, 'to_numpy'):
+        # pandas Series, including nullable Int/Float dtypes holding pd.NA
+        return values.to_numpy(dtype='float64', na_value=np.nan)
+    return np.asarray(values, dtype='float64')
+
+
+def _composite_score_array(mood, sleep_hours=None, appetite=None, concentration=None, skip_missing=False):
+    """
+    Column-wise compute_composite_score over float64 arrays (unrounded).
+    Mirrors the scalar arithmetic step by step (same operations in the same
+    order) so every element is bit-identical to the per-row result. A column
+    passed as None is left out of the weighting. With ``skip_missing`` NaN
+    entries are masked out row by row, like None in the scalar version;
+    otherwise they flow through the arithmetic as NaN.
+    """
+    mood_normalized = (mood / 10.0) * 100
+    score = mood_normalized * 0.4
+    weights_sum = np.full(mood.shape, 0.4)
+
+    def add(score, weights_sum, values, component_score):
+        if skip_missing:
+            present = ~np.isnan(values)
+            return (np.where(present, score + component_score * 0.2, score),
+                    np.where(present, weights_sum + 0.2, weights_sum))
+        return score + component_score * 0.2, weights_sum + 0.2
+
+    if sleep_hours is not None:
+        # sleep bands: 7-9h optimal, then 80/60/40 as hours drift away
+        sleep_score = np.select(
+            [
+                (7 <= sleep_hours) & (sleep_hours <= 9),
+                ((6 <= sleep_hours) & (sleep_hours < 7)) | ((9 < sleep_hours) & (sleep_hours <= 10)),
+                ((5 <= sleep_hours) & (sleep_hours < 6)) | ((10 < sleep_hours) & (sleep_hours <= 11)),
+            ],
+            [100, 80, 60],
+            default=40,
+        )
+        score, weights_sum = add(score, weights_sum, sleep_hours, sleep_score)
+
+    for component in (appetite, concentration):
+        if component is not None:
+            score, weights_sum = add(score, weights_sum, component, (component / 10.0) * 100)
+
+    return score / weights_sum * 100
+
+
+def compute_composite_scores(mood, sleep_hours=None, appetite=None, concentration=None):
+    """
+    Batch version of compute_composite_score.
+    Takes NumPy arrays, pandas Series or lists of equal length. Missing
+    values (None/NaN) in sleep_hours, appetite or concentration are masked
+    out and the weights renormalised per row, exactly like passing None to
+    the scalar function. Rows with a missing mood score NaN.
+    Returns a float64 array with the same per-row values as the scalar API.
+    """
+    if not _has_pandas():
+        raise RuntimeError('pandas/numpy required')
+    raw = _composite_score_array(
+        _as_float_array(mood),
+        None if sleep_hours is None else _as_float_array(sleep_hours),
+        None if appetite is None else _as_float_array(appetite),
+        None if concentration is None else _as_float_array(concentration),
+        skip_missing=True,
+    )
+    # Python's round() (not np.round) so ties round exactly as the scalar path
+    return np.array([round(v, 2) for v in raw.tolist()], dtype='float64')
+
+
 def alerts(threshold=3, days=30):
     df = _load_entries()
     if df is None:
@@ -156,56 +283,65 @@ def alerts(threshold=3, days=30):
     if df.empty:
         return {'count':0,'items':[]}
     cutoff = pd.Timestamp.now() - pd.Timedelta(days=days)
-    recent = df[df['created'] >= cutoff]
-    
-    # Enhanced alert detection with composite scoring
+    recent = df[(df['created'] >= cutoff) & df['handle'].notna()]
+    if recent.empty:
+        return {'count': 0, 'items': []}
+
+    # One stable sort puts every user's entries together, users in order of
+    # first appearance and each user's rows by date; the segments between
+    # handle changes then play the role of the old per-handle loop.
+    codes, handles = pd.factorize(recent['handle'])
+    order = np.lexsort((recent['created'].to_numpy().view('i8'), codes))
+    rows = recent.iloc[order]
+    codes = codes[order]
+    n = len(rows)
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    ends = np.r_[starts[1:], n]
+
+    def column(name):
+        if name not in rows.columns:
+            return None
+        return _as_float_array(pd.to_numeric(rows[name], errors='coerce'))
+
+    mood = column('mood')
+    scores = _composite_score_array(mood, column('sleep_hours'), column('appetite'), column('concentration'))
+    # Python's round(), exactly what the per-row path produced
+    scores = [round(v, 2) for v in scores.tolist()]
+
+    # per-user average of the rounded scores (same left-to-right sum as before)
+    avg = [sum(scores[a:b]) / (b - a) for a, b in zip(starts.tolist(), ends.tolist())]
+
+    # negative trend: the user's last three moods never go up
+    sizes = ends - starts
+    last = ends - 1
+    trend = (sizes >= 3) & ~(mood[np.maximum(last - 1, 0)] > mood[np.maximum(last - 2, 0)]) \
+        & ~(mood[last] > mood[np.maximum(last - 1, 0)])
+    trend = trend.tolist()
+    risk = [compute_risk_level(a, t) for a, t in zip(avg, trend)]
+
+    # a row is reported when its mood is at/below threshold or its user is ALTO
+    row_group = np.repeat(np.arange(len(starts)), sizes)
+    emit = (mood <= threshold) | np.array([r == 'ALTO' for r in risk])[row_group]
+
     alerts_items = []
-    
-    for handle in recent['handle'].unique():
-        user_entries = recent[recent['handle'] == handle].sort_values('created')
-        
-        if user_entries.empty:
-            continue
-        
-        # Calculate composite scores for each entry
-        entries_with_scores = []
-        for _, row in user_entries.iterrows():
-            mood = row.get('mood', 5)
-            sleep_hours = row.get('sleep_hours') if 'sleep_hours' in row.index else None
-            appetite = row.get('appetite') if 'appetite' in row.index else None
-            concentration = row.get('concentration') if 'concentration' in row.index else None
-            
-            composite = compute_composite_score(mood, sleep_hours, appetite, concentration)
-            
-            entries_with_scores.append({
-                'id': int(row.get('id', 0)),
-                'handle': handle,
-                'mood': float(mood),
-                'composite_score': composite,
-                'created': pd.Timestamp(row.get('created')).isoformat(),
-                'comment': row.get('comment') or ''
-            })
-        
-        # Calculate average composite score
-        avg_composite = sum(e['composite_score'] for e in entries_with_scores) / len(entries_with_scores)
-        
-        # Detect trend
-        trend_negative = detect_negative_trend(entries_with_scores, window=3)
-        
-        # Determine risk level
-        risk_level = compute_risk_level(avg_composite, trend_negative)
-        
-        # Add to alerts if not BAJO or if mood critically low
-        if risk_level != 'BAJO' or any(e['mood'] <= threshold for e in entries_with_scores):
-            for entry in entries_with_scores:
-                if entry['mood'] <= threshold or risk_level == 'ALTO':
-                    alerts_items.append({
-                        **entry,
-                        'risk_level': risk_level,
-                        'avg_composite': round(avg_composite, 2),
-                        'trend_negative': trend_negative
-                    })
-    
+    ids = rows['id'].tolist()
+    created = rows['created'].tolist()
+    comments = rows['comment'].tolist() if 'comment' in rows.columns else [None] * n
+    moods = mood.tolist()
+    for i in np.flatnonzero(emit).tolist():
+        g = row_group[i]
+        alerts_items.append({
+            'id': int(ids[i]),
+            'handle': handles[codes[i]],
+            'mood': moods[i],
+            'composite_score': scores[i],
+            'created': pd.Timestamp(created[i]).isoformat(),
+            'comment': comments[i] or '',
+            'risk_level': risk[g],
+            'avg_composite': round(avg[g], 2),
+            'trend_negative': trend[g]
+        })
+
     return {'count': len(alerts_items), 'items': alerts_items}
 
 
@@ -214,7 +350,7 @@ def get_recommendations_for_risk(risk_level='MODERADO'):
     Get personalized recommendations based on risk level.
     Returns list of recommendations from recommendations.csv.
     """
-    if not _HAS_PANDAS:
+    if not _has_pandas():
         # Fallback recommendations without pandas
         fallback = {
             'ALTO': [
@@ -255,6 +391,31 @@ def get_recommendations_for_risk(risk_level='MODERADO'):
         return []
 
 
+def correlation_report(correlations_dict, sample_size):
+    """
+    Build the /api/insights/correlations payload from {'mood_vs_<col>': r}.
+    Shared by correlations() and the running aggregates.
+    """
+    interpretations = []
+    for key, value in correlations_dict.items():
+        abs_val = abs(value)
+        if abs_val > 0.7:
+            strength = "fuerte"
+        elif abs_val > 0.4:
+            strength = "moderada"
+        else:
+            strength = "débil"
+        
+        direction = "positiva" if value > 0 else "negativa"
+        interpretations.append(f"{key}: correlación {strength} {direction} ({value})")
+    
+    return {
+        'correlations': correlations_dict,
+        'interpretations': interpretations,
+        'sample_size': sample_size
+    }
+
+
 def correlations():
     """
     Calculate correlations between mood and extended fields.
@@ -285,46 +446,100 @@ def correlations():
                     if not math.isnan(corr_value):
                         correlations_dict[f'mood_vs_{col}'] = round(float(corr_value), 3)
         
-        # Add interpretation
-        interpretations = []
-        for key, value in correlations_dict.items():
-            abs_val = abs(value)
-            if abs_val > 0.7:
-                strength = "fuerte"
-            elif abs_val > 0.4:
-                strength = "moderada"
-            else:
-                strength = "débil"
-            
-            direction = "positiva" if value > 0 else "negativa"
-            interpretations.append(f"{key}: correlación {strength} {direction} ({value})")
-        
-        return {
-            'correlations': correlations_dict,
-            'interpretations': interpretations,
-            'sample_size': int(df.shape[0])
-        }
+        return correlation_report(correlations_dict, int(df.shape[0]))
     except Exception as e:
         return {'error': f'Error calculating correlations: {str(e)}'}
 
 
-def plot_png(plot_name: str, plot_type: str = None) -> Optional[bytes]:
-    """Generate PNG bytes for supported plots: 'hist', 'by_handle', 'ts'"""
-    if not _HAS_PANDAS:
+_PLOT_LOCK = threading.Lock()
+_PLOT_CACHE = OrderedDict()
+
+
+def _plot_key(plot_name, plot_type):
+    return (plot_name, plot_type.lower() if plot_type else None, _entries_version())
+
+
+def _etag(key):
+    return '"' + hashlib.sha1(repr(key).encode('utf-8')).hexdigest() + '"'
+
+
+def plot_etag(plot_name: str, plot_type: str = None) -> str:
+    """ETag the plot would carry right now; costs a stat, no rendering."""
+    return _etag(_plot_key(plot_name, plot_type))
+
+
+def lookup_plot(plot_name: str, plot_type: str = None):
+    """
+    Look a plot up in the bounded LRU keyed on (plot, type, data version).
+    Returns (key, etag, png bytes or None); a changed data file changes the
+    key, so stale images simply age out.
+    """
+    key = _plot_key(plot_name, plot_type)
+    with _PLOT_LOCK:
+        png = _PLOT_CACHE.get(key)
+        if png is not None:
+            _PLOT_CACHE.move_to_end(key)
+    return key, _etag(key), png
+
+
+def remember_plot(key, png: bytes) -> None:
+    with _PLOT_LOCK:
+        _PLOT_CACHE[key] = png
+        _PLOT_CACHE.move_to_end(key)
+        while len(_PLOT_CACHE) > config.PLOT_CACHE_SIZE:
+            _PLOT_CACHE.popitem(last=False)
+
+
+def cached_plot(plot_name: str, plot_type: str = None):
+    """plot_png through the LRU, rendered in-process. Returns (etag, png or None)."""
+    key, etag, png = lookup_plot(plot_name, plot_type)
+    if png is None:
+        png = plot_png(plot_name, plot_type)
+        if png is not None:
+            remember_plot(key, png)
+    return etag, png
+
+
+def _figure_png(fig) -> bytes:
+    buf = BytesIO()
+    fig.tight_layout()
+    fig.savefig(buf, format='png')
+    buf.seek(0)
+    return buf.read()
+
+
+def plot_png(plot_name: str, plot_type: str = None, series=None) -> Optional[bytes]:
+    """
+    Generate PNG bytes for supported plots: 'hist', 'by_handle', 'ts'.
+    Uses the object-oriented Figure API only (no pyplot global state), so
+    concurrent renders never share a current figure.
+    For 'ts', ``series`` may carry the [(day, mean mood)] points already
+    (from the running rollups); the entries are then not loaded at all.
+    """
+    if not _has_pandas():
         return None
     try:
         import matplotlib
         matplotlib.use('Agg')
-        import matplotlib.pyplot as plt
+        from matplotlib.figure import Figure
         import seaborn as sns
     except Exception:
         return None
 
+    if plot_name == 'ts' and series is not None:
+        if not series:
+            return None
+        days, means = zip(*series)
+        ts = pd.Series(means, index=pd.DatetimeIndex(days, name='created'))
+        try:
+            return _ts_png(ts, plot_type)
+        except Exception:
+            return None
+
     df = _load_entries()
     if df is None or df.empty:
         return None
 
-    buf = BytesIO()
     try:
         if plot_name == 'hist':
             # distribution of mood values
@@ -336,19 +551,16 @@ def plot_png(plot_name: str, plot_type: str = None) -> Optional[bytes]:
                     return None
                 labels = [str(i) for i in counts.index]
                 sizes = counts.values
-                plt.figure(figsize=(6,6))
+                fig = Figure(figsize=(6,6))
+                ax = fig.add_subplot()
                 if plot_type.lower() == 'doughnut':
                     # draw a doughnut by setting wedgeprops width
-                    plt.pie(sizes, labels=labels, autopct='%1.1f%%', startangle=90, wedgeprops={'width':0.4})
-                    plt.title('Mood distribution (doughnut)')
+                    ax.pie(sizes, labels=labels, autopct='%1.1f%%', startangle=90, wedgeprops={'width':0.4})
+                    ax.set_title('Mood distribution (doughnut)')
                 else:
-                    plt.pie(sizes, labels=labels, autopct='%1.1f%%', startangle=90)
-                    plt.title('Mood distribution (pie)')
-                plt.tight_layout()
-                plt.savefig(buf, format='png')
-                plt.close()
-                buf.seek(0)
-                return buf.read()
+                    ax.pie(sizes, labels=labels, autopct='%1.1f%%', startangle=90)
+                    ax.set_title('Mood distribution (pie)')
+                return _figure_png(fig)
             if plot_type and plot_type.lower() in ('scatter','points'):
                 # scatter of mood over time - fallback to index if created missing
                 x = None
@@ -356,89 +568,73 @@ def plot_png(plot_name: str, plot_type: str = None) -> Optional[bytes]:
                     x = df['created']
                 else:
                     x = range(len(df))
-                plt.figure(figsize=(10,4))
-                plt.scatter(x, df['mood'], alpha=0.6)
-                plt.title('Mood scatter over time')
-                try:
-                    plt.xticks(rotation=45)
-                except Exception:
-                    pass
-                plt.tight_layout()
-                plt.savefig(buf, format='png')
-                plt.close()
-                buf.seek(0)
-                return buf.read()
+                fig = Figure(figsize=(10,4))
+                ax = fig.add_subplot()
+                ax.scatter(x, df['mood'], alpha=0.6)
+                ax.set_title('Mood scatter over time')
+                ax.tick_params(axis='x', labelrotation=45)
+                return _figure_png(fig)
             # default: histogram
-            plt.figure(figsize=(8,4))
-            sns.histplot(vals, bins=10)
-            plt.title('Mood distribution')
-            plt.tight_layout()
-            plt.savefig(buf, format='png')
-            plt.close()
-            buf.seek(0)
-            return buf.read()
+            fig = Figure(figsize=(8,4))
+            ax = fig.add_subplot()
+            sns.histplot(vals, bins=10, ax=ax)
+            ax.set_title('Mood distribution')
+            return _figure_png(fig)
 
         if plot_name == 'by_handle':
             # Show top handles
             top = df['handle'].value_counts().head(10).index.tolist()
             sub = df[df['handle'].isin(top)]
+            if isinstance(sub['handle'].dtype, pd.CategoricalDtype):
+                # seaborn draws a slot for every category, used or not
+                sub = sub.assign(handle=sub['handle'].cat.remove_unused_categories())
             if plot_type and plot_type.lower() in ('pie','doughnut'):
                 counts = df['handle'].value_counts().head(10)
-                plt.figure(figsize=(6,6))
-                plt.pie(counts.values, labels=counts.index, autopct='%1.1f%%', startangle=90)
-                plt.title('Entries by handle (top 10)')
-                plt.tight_layout()
-                plt.savefig(buf, format='png')
-                plt.close()
-                buf.seek(0)
-                return buf.read()
+                fig = Figure(figsize=(6,6))
+                ax = fig.add_subplot()
+                ax.pie(counts.values, labels=counts.index, autopct='%1.1f%%', startangle=90)
+                ax.set_title('Entries by handle (top 10)')
+                return _figure_png(fig)
             if plot_type and plot_type.lower() in ('scatter','points'):
-                plt.figure(figsize=(10,6))
+                fig = Figure(figsize=(10,6))
+                ax = fig.add_subplot()
                 # stripplot/jitter to represent points per handle
-                sns.stripplot(x='mood', y='handle', data=sub, jitter=True)
-                plt.title('Mood points by handle (top 10)')
-                plt.tight_layout()
-                plt.savefig(buf, format='png')
-                plt.close()
-                buf.seek(0)
-                return buf.read()
+                sns.stripplot(x='mood', y='handle', data=sub, jitter=True, ax=ax)
+                ax.set_title('Mood points by handle (top 10)')
+                return _figure_png(fig)
             # default: boxplot
-            plt.figure(figsize=(10,6))
-            sns.boxplot(x='handle', y='mood', data=sub)
-            plt.xticks(rotation=45)
-            plt.title('Mood by handle (top 10)')
-            plt.tight_layout()
-            plt.savefig(buf, format='png')
-            plt.close()
-            buf.seek(0)
-            return buf.read()
+            fig = Figure(figsize=(10,6))
+            ax = fig.add_subplot()
+            sns.boxplot(x='handle', y='mood', data=sub, ax=ax)
+            ax.tick_params(axis='x', labelrotation=45)
+            ax.set_title('Mood by handle (top 10)')
+            return _figure_png(fig)
 
         if plot_name == 'ts':
             if 'created' not in df.columns:
                 return None
             ts = df.set_index('created').resample('D')['mood'].mean().dropna()
-            ts = ts.last('90D')
-            if plot_type and plot_type.lower() in ('scatter','points'):
-                plt.figure(figsize=(10,4))
-                plt.scatter(ts.index, ts.values, alpha=0.7)
-                plt.title('Average mood per day (points)')
-                plt.xticks(rotation=45)
-                plt.tight_layout()
-                plt.savefig(buf, format='png')
-                plt.close()
-                buf.seek(0)
-                return buf.read()
-            # default line
-            plt.figure(figsize=(10,4))
-            sns.lineplot(x=ts.index, y=ts.values)
-            plt.title('Average mood per day')
-            plt.xticks(rotation=45)
-            plt.tight_layout()
-            plt.savefig(buf, format='png')
-            plt.close()
-            buf.seek(0)
-            return buf.read()
+            if not ts.empty:
+                # the last 90 days counted back from the newest entry
+                ts = ts[ts.index > ts.index[-1] - pd.Timedelta(days=90)]
+            return _ts_png(ts, plot_type)
     except Exception:
         return None
 
     return None
+
+
+def _ts_png(ts, plot_type=None):
+    from matplotlib.figure import Figure
+    import seaborn as sns
+    fig = Figure(figsize=(10,4))
+    ax = fig.add_subplot()
+    if plot_type and plot_type.lower() in ('scatter','points'):
+        ax.scatter(ts.index, ts.values, alpha=0.7)
+        ax.set_title('Average mood per day (points)')
+    else:
+        # default line
+        sns.lineplot(x=ts.index, y=ts.values, ax=ax)
+        ax.set_title('Average mood per day')
+    ax.tick_params(axis='x', labelrotation=45)
+    return _figure_png(fig)
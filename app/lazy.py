@@ -0,0 +1,65 @@
+"""
+Deferred imports for the analytics stack.
+
+pandas, numpy, matplotlib and seaborn take a large share of the server's
+start-up time, yet auth and entry writes never touch them. Modules bind
+``pd``/``np`` from here instead of importing them directly; the real
+import happens the first time an attribute is read. warm_up() pays that
+cost up front for deployments that would rather start slower than serve
+a slow first insights request.
+"""
+import importlib
+import threading
+
+_LOCK = threading.RLock()
+# module name -> imported module, or None when the import failed
+_LOADED = {}
+
+
+def _import(name):
+    with _LOCK:
+        if name not in _LOADED:
+            try:
+                _LOADED[name] = importlib.import_module(name)
+            except Exception:
+                # not installed, or installed but broken (e.g. built against
+                # another numpy); either way callers take their fallback path
+                _LOADED[name] = None
+        return _LOADED[name]
+
+
+def available(name):
+    """True if ``name`` imports cleanly; imports it on the first call."""
+    return _import(name) is not None
+
+
+class LazyModule:
+    """Stand-in for a module that is imported on first attribute access."""
+
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attr):
+        module = _import(self._name)
+        if module is None:
+            raise ImportError(f'{self._name} is not available')
+        return getattr(module, attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._name in _LOADED else 'not loaded'
+        return f'<lazy module {self._name!r} ({state})>'
+
+
+pd = LazyModule('pandas')
+np = LazyModule('numpy')
+
+# what warm_up() imports, in dependency order
+WARM_MODULES = ('numpy', 'pandas', 'pyarrow', 'matplotlib', 'seaborn')
+
+
+def warm_up(modules=WARM_MODULES):
+    """Import ``modules`` now; returns {name: imported?}."""
+    if 'matplotlib' in modules and available('matplotlib'):
+        # pick the headless backend before anything (seaborn) loads pyplot
+        _LOADED['matplotlib'].use('Agg')
+    return {name: available(name) for name in modules}
@@ -0,0 +1,312 @@
+"""
+Versioned schema migrations for entries.csv.
+
+Each Step turns rows of one schema version into the next. migrate()
+streams the CSV through every pending step into a temp file next to it,
+one record at a time, so memory stays flat whatever the size of the file:
+
+  1. copy phase, without any lock: the server keeps appending while the
+     rows already in the file are converted. Progress is checkpointed
+     every CHECKPOINT_ROWS rows (temp file fsynced first), so a run that
+     is interrupted picks up where it stopped;
+  2. swap phase, under the entries append lock (the id allocator's
+     _FileLock, held by every server worker while it appends): the rows
+     appended during the copy are converted, the temp file replaces the
+     CSV with an atomic rename, and the lock is released. Ingestion only
+     waits for that tail.
+
+The CSV itself is never written to, so a crash at any point leaves
+either the old file or the new one. The version a file is at is
+recorded in a <name>.schema.json sidecar; files without one (or whose
+header disagrees with it) are recognised by their header.
+
+Steps keep ids and the values already stored: the running aggregates and
+the mapped entry table follow the CSV by id and are not rebuilt. The
+columnar snapshot is dropped after the swap.
+"""
+import csv
+import io
+import json
+import os
+import shutil
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Tuple
+
+from .snapshot import _check, invalidate
+from .storage import ENTRIES, _IdAllocator, _iter_records, _parse_record, _read_record, _shared
+
+# rows converted between two checkpoints
+CHECKPOINT_ROWS = 50000
+
+
+class MigrationError(Exception):
+    """The CSV can't be migrated as asked (unknown schema, downgrade)."""
+
+
+@dataclass(frozen=True)
+class Step:
+    """One schema change, from ``version - 1`` to ``version``.
+
+    ``upgrade`` gets a row as a dict keyed by the previous columns and
+    returns it keyed by ``columns``.
+    """
+    version: int
+    description: str
+    columns: Tuple[str, ...]
+    upgrade: Callable[[dict], dict]
+
+
+# entries.csv as the first releases wrote it
+BASE_COLUMNS = ('id', 'account_id', 'handle', 'mood', 'comment', 'created')
+
+
+def _add_extended_fields(row):
+    # older entries have no value for these; blank is what the readers expect
+    row.update(sleep_hours='', appetite='', concentration='')
+    return row
+
+
+STEPS = (
+    Step(2, 'add sleep_hours, appetite and concentration',
+         ('id', 'account_id', 'handle', 'mood', 'comment', 'sleep_hours', 'appetite', 'concentration', 'created'),
+         _add_extended_fields),
+)
+
+LATEST = STEPS[-1].version if STEPS else 1
+
+
+def columns(version):
+    """Header of entries.csv at schema ``version``."""
+    if version == 1:
+        return BASE_COLUMNS
+    for step in STEPS:
+        if step.version == version:
+            return step.columns
+    raise MigrationError(f'unknown schema version {version}')
+
+
+def _schema_path(csv_path):
+    return os.path.splitext(csv_path)[0] + '.schema.json'
+
+
+def _checkpoint_path(csv_path):
+    return csv_path + '.migrate.json'
+
+
+def _temp_path(csv_path):
+    return csv_path + '.migrate.tmp'
+
+
+def _read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, data):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def schema_version(csv_path=ENTRIES, header=None):
+    """Schema version of the CSV: the recorded one if the header agrees,
+    otherwise the newest version with that header."""
+    if header is None:
+        with open(csv_path, 'rb') as f:
+            header = _parse_record(_read_record(f, 0))
+    header = tuple(header)
+    recorded = (_read_json(_schema_path(csv_path)) or {}).get('version')
+    if recorded in range(1, LATEST + 1) and columns(recorded) == header:
+        return recorded
+    for version in range(LATEST, 0, -1):
+        if columns(version) == header:
+            return version
+    raise MigrationError(f'{csv_path}: unknown header {list(header)}')
+
+
+def pending(csv_path=ENTRIES, target=None):
+    """The steps migrate() would apply, in order."""
+    target = LATEST if target is None else target
+    current = schema_version(csv_path)
+    if target > LATEST or target < 1:
+        raise MigrationError(f'unknown schema version {target}')
+    if target < current:
+        raise MigrationError(f'{csv_path} is at version {current}; downgrades are not supported')
+    return [s for s in STEPS if current < s.version <= target]
+
+
+class _Converter:
+    """Runs raw CSV records through the pending steps."""
+
+    def __init__(self, header, steps):
+        self.header = tuple(header)
+        self.steps = steps
+        self.columns = steps[-1].columns
+        self._buf = io.StringIO()
+        self._writer = csv.writer(self._buf)
+        self.rows = 0
+        # records that don't parse against the header, copied unchanged
+        self.kept = 0
+
+    def _encode(self, values):
+        self._writer.writerow(values)
+        data = self._buf.getvalue().encode('utf-8')
+        self._buf.seek(0)
+        self._buf.truncate()
+        return data
+
+    def header_bytes(self):
+        return self._encode(self.columns)
+
+    def convert(self, raw):
+        try:
+            fields = _parse_record(raw)
+        except UnicodeDecodeError:
+            fields = None
+        if fields is not None and len(fields) == len(self.columns) != len(self.header):
+            # appended by a server that already writes the new layout
+            self.rows += 1
+            return raw if raw.endswith(b'\n') else raw + b'\n'
+        if fields is None or len(fields) != len(self.header):
+            # the readers skip such rows; keep them for whoever repairs the file
+            self.kept += 1
+            return raw if raw.endswith(b'\n') else raw + b'\n'
+        row = dict(zip(self.header, fields))
+        for step in self.steps:
+            row = step.upgrade(row)
+        self.rows += 1
+        return self._encode([row.get(c, '') for c in self.columns])
+
+
+def _whole(raw):
+    # a record the server has finished appending
+    return raw.endswith(b'\n') and raw.count(b'"') % 2 == 0
+
+
+def _resume(csv_path, src, current, target):
+    # the checkpoint, if it belongs to this file and this migration
+    state = _read_json(_checkpoint_path(csv_path))
+    tmp = _temp_path(csv_path)
+    if not state or not os.path.exists(tmp):
+        return None
+    st = os.fstat(src.fileno())
+    if [state.get(k) for k in ('from', 'to', 'dev', 'ino')] != [current, target, st.st_dev, st.st_ino]:
+        return None
+    if st.st_size < state['read'] or os.path.getsize(tmp) < state['written']:
+        return None
+    # the converted prefix must still be what the CSV holds
+    if _check(src, state['read']) != state['check']:
+        return None
+    return state
+
+
+def _backup(csv_path):
+    base, ext = os.path.splitext(csv_path)
+    path = f'{base}_backup_{datetime.now().strftime("%Y%m%d_%H%M%S")}{ext}'
+    try:
+        # the old file lives on under this name once the new one replaces it
+        os.link(csv_path, path)
+    except OSError:
+        shutil.copy2(csv_path, path)
+    return path
+
+
+def migrate(csv_path=ENTRIES, target=None, backup=True, checkpoint_rows=CHECKPOINT_ROWS, progress=None):
+    """
+    Bring ``csv_path`` to schema ``target`` (the latest by default).
+
+    Safe to run while the server is up, and to re-run after an
+    interruption. ``progress(rows)`` is called at every checkpoint.
+    Returns a summary dict, or None when the file was already current.
+    """
+    steps = pending(csv_path, target)
+    if not steps:
+        return None
+    current, target = steps[0].version - 1, steps[-1].version
+    checkpoint = _checkpoint_path(csv_path)
+    tmp = _temp_path(csv_path)
+
+    with open(csv_path, 'rb') as src:
+        header = _read_record(src, 0)
+        conv = _Converter(_parse_record(header), steps)
+        st = os.fstat(src.fileno())
+        state = _resume(csv_path, src, current, target)
+        if state:
+            read, written = state['read'], state['written']
+            conv.rows, conv.kept = state['rows'], state['kept']
+            out = open(tmp, 'r+b')
+            out.truncate(written)
+            out.seek(written)
+        else:
+            out = open(tmp, 'wb')
+            read = len(header)
+            written = out.write(conv.header_bytes())
+        # what has been copied so far: (read, written, rows, kept), always
+        # rebound in one assignment so an interrupt never sees half of it
+        done = (read, written, conv.rows, conv.kept)
+
+        def save(done):
+            read, written, rows, kept = done
+            out.flush()
+            os.fsync(out.fileno())
+            pos = src.tell()
+            _write_json(checkpoint, {'from': current, 'to': target, 'dev': st.st_dev, 'ino': st.st_ino,
+                                     'read': read, 'written': written, 'check': _check(src, read),
+                                     'rows': rows, 'kept': kept})
+            src.seek(pos)
+            if progress:
+                progress(rows)
+
+        with out:
+            since = 0
+            try:
+                for offset, raw in _iter_records(src, read):
+                    if not _whole(raw):
+                        # still being appended; the swap phase takes it
+                        break
+                    chunk = conv.convert(raw)
+                    n = out.write(chunk)
+                    done = (offset + len(raw), done[1] + n, conv.rows, conv.kept)
+                    since += 1
+                    if since >= checkpoint_rows:
+                        save(done)
+                        since = 0
+            except BaseException:
+                # bytes written past done[1] are cut on resume
+                save(done)
+                raise
+            read = done[0]
+
+            ids = _shared('ids', csv_path, lambda: _IdAllocator(csv_path))
+            before = conv.rows + conv.kept
+            with ids.lock:
+                locked = time.perf_counter()
+                for _, raw in _iter_records(src, read):
+                    out.write(conv.convert(raw))
+                out.flush()
+                os.fsync(out.fileno())
+                backup_path = _backup(csv_path) if backup else None
+                os.replace(tmp, csv_path)
+                _write_json(_schema_path(csv_path), {'version': target})
+                ids.resync()
+                locked = time.perf_counter() - locked
+
+    _remove(checkpoint)
+    invalidate(csv_path)
+    return {'from': current, 'to': target, 'rows': conv.rows, 'kept': conv.kept, 'resumed': bool(state),
+            'tail_rows': conv.rows + conv.kept - before, 'locked_s': locked, 'backup': backup_path}
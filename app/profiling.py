@@ -0,0 +1,197 @@
+"""
+On-demand sampling profiles of single requests.
+
+Off unless MOODKEEPER_PROFILING=1 and MOODKEEPER_PROFILE_TOKEN are set;
+then a request carrying that token (``X-Profile: <token>`` header or
+``?profile=<token>``) is profiled while it runs. A sampler thread reads
+every thread's stack each PROFILE_INTERVAL seconds and keeps the samples
+that belong to this request:
+
+  - on the event loop, stacks that pass through this request's
+    middleware frame (async handlers, awaits in progress);
+  - on worker threads, stacks running under this request's contextvars
+    context (sync handlers and run_in_threadpool calls, which anyio runs
+    with a copy of the request's context).
+
+Samples are written as collapsed stacks ("root;caller;callee count" per
+line, the input of flamegraph.pl / speedscope / inferno) under
+PROFILE_DIR; the response names the file in an X-Profile-File header.
+Only the newest PROFILE_KEEP profiles are kept; older ones are deleted
+as new ones are written.
+Plot renders run in worker processes and don't show up.
+
+Requests without the token only pay for a header scan.
+"""
+import contextvars
+import hmac
+import os
+import re
+import sys
+import threading
+from collections import Counter
+from datetime import datetime
+from urllib.parse import parse_qs
+
+from . import config
+
+_PROFILED = contextvars.ContextVar('moodkeeper_profiled', default=None)
+
+_HEADER = b'x-profile'
+
+# where finished profiles are fetched from; never profiled itself
+DOWNLOAD_PREFIX = '/api/profiles/'
+
+# anything else in a request path becomes '_' in the profile's file name
+_UNSAFE = re.compile(r'[^A-Za-z0-9_.-]')
+
+ROOT = config.ROOT
+
+
+def _label(code):
+    path = code.co_filename
+    if path.startswith(ROOT):
+        path = os.path.relpath(path, ROOT)
+    return f'{code.co_name} ({path}:{code.co_firstlineno})'
+
+
+class StackSampler:
+    """Samples the threads working on one request until stopped."""
+
+    def __init__(self, interval=None):
+        self.interval = config.PROFILE_INTERVAL if interval is None else interval
+        self.samples = Counter()
+        self.taken = 0
+        self._anchor = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, anchor):
+        """``anchor`` is the request's middleware frame on the event loop."""
+        self._anchor = anchor
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._anchor = None
+
+    def _mine(self, frame):
+        # (stack from the root, belongs to this request?)
+        stack = []
+        mine = False
+        while frame is not None:
+            if frame is self._anchor:
+                mine = True
+            elif not mine and 'context' in frame.f_code.co_varnames:
+                ctx = frame.f_locals.get('context')
+                if isinstance(ctx, contextvars.Context) and ctx.get(_PROFILED) is self:
+                    mine = True
+            stack.append(frame.f_code)
+            frame = frame.f_back
+        stack.reverse()
+        return stack, mine
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack, mine = self._mine(frame)
+                if mine:
+                    key = (names.get(ident, str(ident)),) + tuple(_label(c) for c in stack)
+                    self.samples[key] += 1
+            self.taken += 1
+
+    def collapsed(self):
+        """The samples in collapsed-stack format, one stack per line."""
+        return ''.join(f'{";".join(stack)} {n}\n' for stack, n in sorted(self.samples.items()))
+
+
+def authorized(value, token=None):
+    """True if ``value`` is the configured profile token (and one is set)."""
+    token = config.PROFILE_TOKEN if token is None else token
+    return bool(token) and value is not None and hmac.compare_digest(value.encode(), token.encode())
+
+
+def profile_path(name, directory=None):
+    """Path of a stored profile, or None for names that aren't one of ours."""
+    directory = directory or config.PROFILE_DIR
+    if _UNSAFE.search(name) or not name.endswith('.collapsed') or name.startswith('.'):
+        return None
+    path = os.path.join(directory, name)
+    return path if os.path.isfile(path) else None
+
+
+def prune(directory=None, keep=None):
+    """Delete all but the newest ``keep`` profiles; returns how many went."""
+    directory = directory or config.PROFILE_DIR
+    keep = config.PROFILE_KEEP if keep is None else keep
+    try:
+        # names start with a timestamp, so name order is age order
+        names = sorted(n for n in os.listdir(directory) if n.endswith('.collapsed'))
+    except OSError:
+        return 0
+    stale = names[:max(0, len(names) - keep)]
+    for name in stale:
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass
+    return len(stale)
+
+
+def _requested(scope, token):
+    for name, value in scope['headers']:
+        if name == _HEADER:
+            return hmac.compare_digest(value, token.encode())
+    qs = scope.get('query_string', b'')
+    if b'profile=' in qs:
+        values = parse_qs(qs.decode('latin-1')).get('profile', [])
+        return any(hmac.compare_digest(v.encode(), token.encode()) for v in values)
+    return False
+
+
+class ProfilingMiddleware:
+    """Profiles requests that carry the admin profile token."""
+
+    def __init__(self, app, token=None, directory=None, interval=None, keep=None):
+        self.app = app
+        self.token = config.PROFILE_TOKEN if token is None else token
+        self.directory = directory or config.PROFILE_DIR
+        self.interval = interval
+        self.keep = config.PROFILE_KEEP if keep is None else keep
+
+    async def __call__(self, scope, receive, send):
+        if (scope['type'] != 'http' or not self.token or scope['path'].startswith(DOWNLOAD_PREFIX)
+                or not _requested(scope, self.token)):
+            await self.app(scope, receive, send)
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        route = _UNSAFE.sub('_', scope['path'].strip('/')) or 'root'
+        name = f'{stamp}-{scope["method"]}-{route[:60]}.collapsed'
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                headers = list(message.get('headers', []))
+                headers.append((b'x-profile-file', name.encode()))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        sampler = StackSampler(self.interval)
+        marker = _PROFILED.set(sampler)
+        sampler.start(sys._getframe())
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop()
+            _PROFILED.reset(marker)
+            # plain collapsed stacks, no header line: flamegraph.pl and
+            # speedscope read the file as is
+            with open(os.path.join(self.directory, name), 'w', encoding='utf-8') as f:
+                f.write(sampler.collapsed())
+            prune(self.directory, self.keep)
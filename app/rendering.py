@@ -0,0 +1,128 @@
+"""
+Plot rendering off the request path.
+
+Plots are rendered in a small pool of worker processes, so a slow
+matplotlib render never holds the event loop or the request threadpool.
+Each worker imports matplotlib/seaborn once at start-up and keeps its
+own cached DataFrame. Admission is bounded: at most PLOT_WORKERS renders
+run and PLOT_QUEUE wait; beyond that callers get PoolSaturated right away
+instead of piling up. Concurrent requests for the same plot (same cache
+key) share one render. A render that times out has its worker processes
+killed, so a hung render can't keep its slot.
+"""
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from . import config
+
+
+class PoolSaturated(Exception):
+    """Every render slot is taken; the caller should back off and retry."""
+
+
+class RenderTimeout(Exception):
+    """A render took longer than the configured timeout."""
+
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.figure  # noqa: F401
+    import seaborn  # noqa: F401
+
+
+def _render(plot_name, plot_type, series):
+    from . import insights
+    return insights.plot_png(plot_name, plot_type, series)
+
+
+class PlotRenderer:
+    def __init__(self, workers=None, queue_depth=None, timeout=None):
+        self.workers = max(1, workers or config.PLOT_WORKERS)
+        self.queue_depth = max(0, config.PLOT_QUEUE if queue_depth is None else queue_depth)
+        self.timeout = timeout or config.PLOT_TIMEOUT
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_depth)
+        self._lock = threading.Lock()
+        self._executor = None
+        # cache key -> task of the render every caller for that key awaits
+        self._inflight = {}
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn: workers must not inherit the server's threads/locks
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                )
+            return self._executor
+
+    def _discard(self, executor, kill=False):
+        # a crashed worker breaks the whole executor; start afresh next time.
+        # ``kill``: also stop workers still running (a render that hung)
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        processes = list((getattr(executor, '_processes', None) or {}).values()) if kill else []
+        executor.shutdown(wait=False, cancel_futures=True)
+        for p in processes:
+            p.terminate()
+
+    async def render(self, plot_name, plot_type=None, series=None, key=None):
+        """PNG bytes (or None for an unknown plot), rendered in a worker.
+
+        ``series`` is handed to insights.plot_png as is, so points the
+        server already holds don't have to be recomputed in the worker.
+        Callers passing the same ``key`` while a render is running wait for
+        that render instead of starting their own.
+        """
+        if key is None:
+            return await self._render(plot_name, plot_type, series)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._render(plot_name, plot_type, series))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shielded: one caller giving up doesn't cancel the others' render
+        return await asyncio.shield(task)
+
+    async def _render(self, plot_name, plot_type, series):
+        if not self._slots.acquire(blocking=False):
+            raise PoolSaturated()
+        once = threading.Lock()
+
+        def release(_=None):
+            # from the worker's completion or from a timeout, whichever is first
+            if once.acquire(blocking=False):
+                self._slots.release()
+
+        executor = self._pool()
+        try:
+            future = executor.submit(_render, plot_name, plot_type, series)
+        except (BrokenProcessPool, RuntimeError):
+            release()
+            self._discard(executor)
+            raise
+        # the slot stays taken until the worker is really done
+        future.add_done_callback(release)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            # cancel() can't stop a render that already started: kill the
+            # workers so the slots come back; the pool restarts on next use
+            self._discard(executor, kill=True)
+            release()
+            raise RenderTimeout()
+        except BrokenProcessPool:
+            self._discard(executor)
+            raise
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
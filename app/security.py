@@ -1,8 +1,15 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from passlib.hash import pbkdf2_sha256
 from datetime import datetime, timedelta
 from jose import jwt, JWTError
 from typing import Optional
 
+from . import config
+
 SECRET = 'change-this-secret'
 ALGO = 'HS256'
 EXP_MIN = 30
@@ -13,15 +20,190 @@ def hash_secret(plain: str) -> str:
 def verify_secret(plain: str, hashed: str) -> bool:
     return pbkdf2_sha256.verify(plain, hashed)
 
+
+class HashPoolBusy(Exception):
+    """Every hashing slot is taken; the caller should back off and retry."""
+
+
+class HashPool:
+    """
+    PBKDF2 runs here instead of on the request threadpool, so a burst of
+    logins can only ever occupy ``workers`` threads. hashlib releases the
+    GIL while it hashes, so those threads really run in parallel. At most
+    ``queue_depth`` more calls may wait; beyond that HashPoolBusy is raised.
+    """
+
+    def __init__(self, workers=None, queue_depth=None):
+        self.workers = max(1, workers or config.HASH_WORKERS)
+        self.queue_depth = max(0, config.HASH_QUEUE if queue_depth is None else queue_depth)
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_depth)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='pbkdf2')
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'rejected': 0, 'hash_seconds': 0.0, 'hash_max': 0.0,
+                       'wait_seconds': 0.0, 'wait_max': 0.0}
+
+    def _timed(self, fn, args, submitted):
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            done = time.perf_counter()
+            wait, took = started - submitted, done - started
+            with self._lock:
+                st = self._stats
+                st['calls'] += 1
+                st['hash_seconds'] += took
+                st['hash_max'] = max(st['hash_max'], took)
+                st['wait_seconds'] += wait
+                st['wait_max'] = max(st['wait_max'], wait)
+
+    async def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise HashPoolBusy()
+        try:
+            future = self._executor.submit(self._timed, fn, args, time.perf_counter())
+        except RuntimeError:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return await asyncio.wrap_future(future)
+
+    async def hash(self, plain: str) -> str:
+        return await self.run(hash_secret, plain)
+
+    async def verify(self, plain: str, hashed: str) -> bool:
+        return await self.run(verify_secret, plain, hashed)
+
+    def stats(self):
+        """Call counts plus hash time and queue wait, in milliseconds."""
+        with self._lock:
+            st = dict(self._stats)
+        n = st['calls']
+        return {
+            'workers': self.workers,
+            'queue_depth': self.queue_depth,
+            'calls': n,
+            'rejected': st['rejected'],
+            'hash_ms_avg': round(st['hash_seconds'] * 1000 / n, 3) if n else None,
+            'hash_ms_max': round(st['hash_max'] * 1000, 3),
+            'wait_ms_avg': round(st['wait_seconds'] * 1000 / n, 3) if n else None,
+            'wait_ms_max': round(st['wait_max'] * 1000, 3),
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+class LoginThrottle:
+    """
+    Failed logins per handle over a sliding window. Once a handle reaches
+    ``max_failures`` within ``window`` seconds further attempts are turned
+    away before any hashing is done, until the oldest failure ages out.
+    """
+
+    def __init__(self, max_failures=None, window=None, max_handles=10000):
+        self.max_failures = config.LOGIN_MAX_FAILURES if max_failures is None else max_failures
+        self.window = config.LOGIN_FAILURE_WINDOW if window is None else window
+        self.max_handles = max_handles
+        self._lock = threading.Lock()
+        self._failures = OrderedDict()
+
+    def _recent(self, handle, now):
+        times = self._failures.get(handle)
+        if times is None:
+            return None
+        while times and times[0] <= now - self.window:
+            times.popleft()
+        if not times:
+            del self._failures[handle]
+            return None
+        return times
+
+    def retry_after(self, handle: str) -> int:
+        """Seconds until ``handle`` may try again; 0 if it may try now."""
+        if self.max_failures <= 0:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            times = self._recent(handle, now)
+            if times is None or len(times) < self.max_failures:
+                return 0
+            return max(1, int(times[0] + self.window - now + 0.999))
+
+    def failed(self, handle: str) -> None:
+        if self.max_failures <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            times = self._recent(handle, now)
+            if times is None:
+                times = self._failures[handle] = deque(maxlen=self.max_failures)
+            times.append(now)
+            self._failures.move_to_end(handle)
+            # handles that stop trying are forgotten oldest-first
+            while len(self._failures) > self.max_handles:
+                self._failures.popitem(last=False)
+
+    def succeeded(self, handle: str) -> None:
+        with self._lock:
+            self._failures.pop(handle, None)
+
 def make_token(subject: str) -> str:
     expire = datetime.utcnow() + timedelta(minutes=EXP_MIN)
     # use a numeric unix timestamp for 'exp' so JWT libraries validate correctly
     payload = {'sub': subject, 'exp': int(expire.timestamp())}
     return jwt.encode(payload, SECRET, algorithm=ALGO)
 
-def read_token(token: str) -> Optional[str]:
+def read_claims(token: str) -> Optional[dict]:
     try:
-        payload = jwt.decode(token, SECRET, algorithms=[ALGO])
-        return payload.get('sub')
+        return jwt.decode(token, SECRET, algorithms=[ALGO])
     except JWTError:
         return None
+
+def read_token(token: str) -> Optional[str]:
+    payload = read_claims(token)
+    return payload.get('sub') if payload else None
+
+
+class TokenCache:
+    """
+    Tokens that already passed verification, mapped to whatever the caller
+    resolved them to. An entry lives until the token's own 'exp' and the
+    least recently used ones are dropped beyond ``maxsize``.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, token: str):
+        with self._lock:
+            hit = self._entries.get(token)
+            if hit is None:
+                return None
+            exp, value = hit
+            if exp <= time.time():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return value
+
+    def put(self, token: str, exp, value) -> None:
+        if self.maxsize <= 0 or not isinstance(exp, (int, float)):
+            return
+        with self._lock:
+            self._entries[token] = (exp, value)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, token: str) -> None:
+        with self._lock:
+            self._entries.pop(token, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
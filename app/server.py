@@ -1,10 +1,23 @@
-from fastapi import FastAPI, HTTPException, status, Depends, Header, Response
+import json
+import threading
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from fastapi import FastAPI, HTTPException, status, Depends, Header, Response, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Tuple
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import Tuple, Optional
+from pydantic import ValidationError
 from .dto import AccountCreate, SessionCreate, AccountOut, EntryCreate, EntryOut
 from .storage import AccountStore, EntryStore
-from .security import hash_secret, verify_secret, make_token, read_token
+from .security import make_token, read_claims, TokenCache, HashPool, HashPoolBusy, LoginThrottle
+from . import config
 from . import insights
+from .rendering import PlotRenderer, PoolSaturated, RenderTimeout
+from .snapshot import Compactor
+from . import lazy
+from . import metrics
+from . import profiling
 from fastapi import Response
 
 app = FastAPI(title='MoodKeeper', description='Service for mood entries', version='0.1')
@@ -20,11 +33,81 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-After-Id", "ETag"],
 )
+if config.METRICS:
+    # added last, so it is the outermost layer and times CORS handling too
+    app.add_middleware(metrics.MetricsMiddleware, routes=app.routes)
+if config.PROFILING and config.PROFILE_TOKEN:
+    # outermost: a profiled request is sampled from the moment it arrives
+    app.add_middleware(profiling.ProfilingMiddleware)
 
 account_store = AccountStore()
 entry_store = EntryStore()
 
+plot_renderer = PlotRenderer()
+# keeps the columnar snapshot the analytics read close to entries.csv
+compactor = Compactor()
+
+# token -> [account, accounts version it was looked up at]
+token_cache = TokenCache(config.TOKEN_CACHE_SIZE)
+
+# PBKDF2 gets its own few threads; failed logins are throttled per handle
+hash_pool = HashPool()
+login_throttle = LoginThrottle()
+
+# upper bound for one page of /api/entries
+MAX_PAGE = 1000
+# upper bound for one /api/entries/bulk request
+MAX_BULK = config.ENTRY_BULK_MAX
+MAX_BULK_BYTES = config.ENTRY_BULK_MAX_BYTES
+
+
+@app.on_event('startup')
+def _startup():
+    if config.STORAGE_BACKEND == 'csv':
+        compactor.start()
+    if config.WARM_UP:
+        # import the analytics stack while the first requests are served,
+        # rather than on the first insights call
+        threading.Thread(target=lazy.warm_up, name='analytics-warm-up', daemon=True).start()
+
+
+@app.on_event('shutdown')
+def _shutdown():
+    compactor.stop()
+    plot_renderer.shutdown()
+    hash_pool.shutdown()
+    entry_store.close()
+
+
+def _resolve_token(token):
+    """(handle, account) behind a bearer token; handle is None if the token doesn't verify.
+
+    A verified token is remembered until it expires, so repeat calls skip the
+    JWT decode; the account is only looked up again once the accounts store
+    has changed since.
+    """
+    version = account_store.version()
+    hit = token_cache.get(token)
+    if hit is not None:
+        account, seen = hit
+        if seen != version:
+            account = account_store.find_by_handle(account.handle)
+            if account is None:
+                token_cache.discard(token)
+                return None, None
+            hit[:] = [account, version]
+        return account.handle, account
+    claims = read_claims(token)
+    handle = claims.get('sub') if claims else None
+    if not handle:
+        return None, None
+    account = account_store.find_by_handle(handle)
+    if account is not None:
+        token_cache.put(token, claims.get('exp'), [account, version])
+    return handle, account
+
 
 def _current_user(authorization: str = Header(..., alias='Authorization')) -> Tuple:
     # Accept standard 'Authorization: Bearer <token>' header
@@ -32,96 +115,277 @@ def _current_user(authorization: str = Header(..., alias='Authorization')) -> Tu
     if not isinstance(auth, str) or not auth.startswith('Bearer '):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid auth scheme')
     token = auth.split(' ', 1)[1]
-    handle = read_token(token)
+    handle, account = _resolve_token(token)
     if not handle:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid or expired token')
-    account = account_store.find_by_handle(handle)
     if not account:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Account not found')
     return account, token
 
 
+def _hashing_busy():
+    return HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail='Server busy, retry shortly',
+                         headers={'Retry-After': '1'})
+
+
 @app.post('/api/accounts', response_model=AccountOut, status_code=status.HTTP_201_CREATED)
-def create_account(acc: AccountCreate):
-    if account_store.find_by_handle(acc.handle):
+async def create_account(acc: AccountCreate):
+    if await run_in_threadpool(account_store.find_by_handle, acc.handle):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Handle already exists')
-    h = hash_secret(acc.secret)
-    a = account_store.create(acc.handle, acc.email, h)
+    try:
+        h = await hash_pool.hash(acc.secret)
+    except HashPoolBusy:
+        raise _hashing_busy()
+    a = await run_in_threadpool(account_store.create, acc.handle, acc.email, h)
     return AccountOut(id=a.id, handle=a.handle, email=a.email, created=a.created)
 
 
 @app.post('/api/sessions')
-def create_session(s: SessionCreate):
-    a = account_store.find_by_handle(s.handle)
-    if not a or not verify_secret(s.secret, a.hashed):
+async def create_session(s: SessionCreate):
+    # refuse before hashing anything once a handle has failed too often
+    wait = login_throttle.retry_after(s.handle)
+    if wait:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail='Too many failed attempts',
+                            headers={'Retry-After': str(wait)})
+    a = await run_in_threadpool(account_store.find_by_handle, s.handle)
+    try:
+        ok = a is not None and await hash_pool.verify(s.secret, a.hashed)
+    except HashPoolBusy:
+        raise _hashing_busy()
+    if not ok:
+        login_throttle.failed(s.handle)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid credentials')
+    login_throttle.succeeded(s.handle)
     t = make_token(a.handle)
     return {'access_token': t, 'token_type': 'bearer'}
 
 
+@app.get('/api/security/hashing')
+def hashing_stats():
+    """Latency and queue-wait figures of the password hashing pool"""
+    return hash_pool.stats()
+
+
 @app.post('/api/sessions/logout')
 def logout(user_and_token = Depends(_current_user)):
     # stateless token: logout is client-side removal; for real revocation implement storage
     user, token = user_and_token
+    token_cache.discard(token)
     return {'message': f'Logged out {user.handle}'}
 
 
-@app.post('/api/entries', response_model=EntryOut, status_code=status.HTTP_201_CREATED)
-def create_entry(entry: EntryCreate, authorization: str = Header(None, alias='Authorization')):
+def _entry_account(authorization):
     # Allow anonymous submissions if Authorization is not provided or invalid
     acct = None
     if authorization and isinstance(authorization, str) and authorization.startswith('Bearer '):
         token = authorization.split(' ', 1)[1]
-        handle = read_token(token)
-        if handle:
-            acct = account_store.find_by_handle(handle)
+        _, acct = _resolve_token(token)
 
     # fallback anonymous account
     if not acct:
         class _Anon: id = 0; handle = 'anonymous'
         acct = _Anon()
+    return acct
+
 
+def _validate_entry(entry: EntryCreate) -> Optional[str]:
+    """First problem with an entry's values, or None if it can be stored."""
     if not (1 <= entry.mood <= 10):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='mood must be 1-10')
-    
+        return 'mood must be 1-10'
     # Validate optional fields
     if entry.sleep_hours is not None and not (0 <= entry.sleep_hours <= 24):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='sleep_hours must be 0-24')
+        return 'sleep_hours must be 0-24'
     if entry.appetite is not None and not (1 <= entry.appetite <= 10):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='appetite must be 1-10')
+        return 'appetite must be 1-10'
     if entry.concentration is not None and not (1 <= entry.concentration <= 10):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='concentration must be 1-10')
-    
+        return 'concentration must be 1-10'
+    return None
+
+
+@app.post('/api/entries', response_model=EntryOut, status_code=status.HTTP_201_CREATED)
+def create_entry(entry: EntryCreate, authorization: str = Header(None, alias='Authorization')):
+    acct = _entry_account(authorization)
+    problem = _validate_entry(entry)
+    if problem:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=problem)
     e = entry_store.create(acct.id, acct.handle, entry.mood, entry.comment, entry.sleep_hours, entry.appetite, entry.concentration)
     return EntryOut(id=e.id, account_id=e.account_id, handle=e.handle, mood=e.mood, comment=e.comment, sleep_hours=e.sleep_hours, appetite=e.appetite, concentration=e.concentration, created=e.created)
 
 
-@app.get('/api/entries')
-def list_entries():
+_BAD_LINE = object()
+
+
+def _bulk_items(body: bytes, content_type: str, limit: int = None):
+    # a JSON array, or NDJSON; an NDJSON line that doesn't parse is kept
+    # as _BAD_LINE so it can be reported on its own. NDJSON parsing stops
+    # after ``limit`` + 1 items: enough to tell the body is over the limit.
+    text = body.decode('utf-8')
+    if 'ndjson' not in content_type and text.lstrip().startswith('['):
+        items = json.loads(text)
+        if not isinstance(items, list):
+            raise ValueError('expected a JSON array')
+        return items
     items = []
-    for e in entry_store.list_all():
-        items.append({
-            'id': e.id, 
-            'account_id': e.account_id, 
-            'handle': e.handle, 
-            'mood': e.mood, 
-            'comment': e.comment, 
-            'sleep_hours': e.sleep_hours,
-            'appetite': e.appetite,
-            'concentration': e.concentration,
-            'created': e.created
-        })
+    start = 0
+    while start < len(text) and (limit is None or len(items) <= limit):
+        end = text.find('\n', start)
+        end = len(text) if end < 0 else end
+        line, start = text[start:end], end + 1
+        if not line.strip():
+            continue
+        try:
+            items.append(json.loads(line))
+        except ValueError:
+            items.append(_BAD_LINE)
     return items
 
 
+async def _bulk_body(request: Request) -> bytes:
+    # the body, refused with 413 as soon as it is known to be over the cap:
+    # from Content-Length up front, else while it streams in
+    too_large = HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                              detail=f'Body larger than {MAX_BULK_BYTES} bytes')
+    length = request.headers.get('content-length')
+    if length is not None and length.isdigit() and int(length) > MAX_BULK_BYTES:
+        raise too_large
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > MAX_BULK_BYTES:
+            raise too_large
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+
+def _validation_message(exc: ValidationError) -> str:
+    return '; '.join(f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in exc.errors())
+
+
+@app.post('/api/entries/bulk')
+async def create_entries_bulk(request: Request, authorization: str = Header(None, alias='Authorization')):
+    """
+    Store many entries in one request. The body is a JSON array of entries
+    or NDJSON (one entry per line). Valid rows are written together, in
+    order, under consecutive ids from first_id to last_id; invalid rows are
+    skipped and listed in errors by their position in the body.
+    """
+    body = await _bulk_body(request)
+    try:
+        items = _bulk_items(body, request.headers.get('content-type', ''), MAX_BULK)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Body must be a JSON array or NDJSON')
+    if len(items) > MAX_BULK:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f'At most {MAX_BULK} entries per request')
+    acct = await run_in_threadpool(_entry_account, authorization)
+    rows, errors = [], []
+    for index, item in enumerate(items):
+        if item is _BAD_LINE:
+            errors.append({'index': index, 'detail': 'invalid JSON'})
+            continue
+        if not isinstance(item, dict):
+            errors.append({'index': index, 'detail': 'expected a JSON object'})
+            continue
+        try:
+            entry = EntryCreate(**item)
+        except ValidationError as exc:
+            errors.append({'index': index, 'detail': _validation_message(exc)})
+            continue
+        problem = _validate_entry(entry)
+        if problem:
+            errors.append({'index': index, 'detail': problem})
+            continue
+        rows.append((acct.id, acct.handle, entry.mood, entry.comment, entry.sleep_hours, entry.appetite,
+                     entry.concentration))
+    records = await run_in_threadpool(entry_store.create_many, rows) if rows else []
+    return {
+        'created': len(records),
+        'first_id': records[0].id if records else None,
+        'last_id': records[-1].id if records else None,
+        'errors': errors,
+    }
+
+
+def _entry_dict(e):
+    return {
+        'id': e.id, 
+        'account_id': e.account_id, 
+        'handle': e.handle, 
+        'mood': e.mood, 
+        'comment': e.comment, 
+        'sleep_hours': e.sleep_hours,
+        'appetite': e.appetite,
+        'concentration': e.concentration,
+        'created': e.created
+    }
+
+
+def _local_naive(dt):
+    # stored timestamps are naive local time
+    if dt is not None and dt.tzinfo is not None:
+        return dt.astimezone().replace(tzinfo=None)
+    return dt
+
+
+def _ndjson(rows, chunk=500):
+    # one JSON object per line, flushed in chunks so the full list never exists
+    buf = []
+    for e in rows:
+        d = _entry_dict(e)
+        d['created'] = e.created.isoformat()
+        buf.append(json.dumps(d, ensure_ascii=False))
+        if len(buf) >= chunk:
+            yield '\n'.join(buf) + '\n'
+            buf = []
+    if buf:
+        yield '\n'.join(buf) + '\n'
+
+
+@app.get('/api/entries')
+def list_entries(response: Response,
+                 after_id: Optional[int] = None,
+                 limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE),
+                 handle: Optional[str] = None,
+                 account_id: Optional[int] = None,
+                 created_from: Optional[datetime] = None,
+                 created_to: Optional[datetime] = None,
+                 format: str = 'json'):
+    """List entries in id order.
+
+    Without parameters the whole table is returned, as before. Pass ``limit``
+    to page: when more rows exist the ``X-Next-After-Id`` header carries the
+    cursor for the next request. ``format=ndjson`` streams rows instead of
+    building one JSON body.
+    """
+    filters = dict(handle=handle, account_id=account_id,
+                   created_from=_local_naive(created_from), created_to=_local_naive(created_to))
+    if format == 'ndjson':
+        rows = entry_store.query(after_id=after_id, limit=limit, **filters)
+        return StreamingResponse(_ndjson(rows), media_type='application/x-ndjson')
+    if format != 'json':
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='format must be json or ndjson')
+    # fetch one extra row to learn whether another page exists
+    rows = list(entry_store.query(after_id=after_id, limit=limit + 1 if limit else None, **filters))
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        response.headers['X-Next-After-Id'] = str(rows[-1].id)
+    return [_entry_dict(e) for e in rows]
+
+
 @app.get('/api/insights/summary')
 def insights_summary():
-    return insights.summary()
+    return entry_store.aggregates.summary()
+
+
+@app.get('/api/insights/cache')
+def insights_cache():
+    """Hit/miss counters of the shared analytics DataFrame cache"""
+    return insights.cache_stats()
 
 
 @app.get('/api/insights/average')
 def insights_avg():
-    return insights.avg_by()
+    return entry_store.aggregates.avg_by()
 
 
 @app.get('/api/insights/alerts')
@@ -129,12 +393,37 @@ def insights_alerts(threshold: float = 3.0, days: int = 30):
     return insights.alerts(threshold=threshold, days=days)
 
 
+def _etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(',')]
+    return '*' in tags or etag in tags or f'W/{etag}' in tags
+
+
 @app.get('/api/insights/plot/{plot_name}')
-def insights_plot(plot_name: str, type: str = None):
-    png = insights.plot_png(plot_name, plot_type=type)
+async def insights_plot(plot_name: str, type: str = None, if_none_match: Optional[str] = Header(None)):
+    # dashboards poll plots; answer 304 from a stat when the data hasn't moved
+    key, etag, png = insights.lookup_plot(plot_name, plot_type=type)
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
     if png is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Plot not available')
-    return Response(content=png, media_type='image/png')
+        try:
+            # the ts plot's points come straight from the daily rollups
+            series = await run_in_threadpool(entry_store.aggregates.daily_mood) if plot_name == 'ts' else None
+            png = await plot_renderer.render(plot_name, type, series, key=key)
+        except PoolSaturated:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail='Plot renderer busy, retry shortly',
+                                headers={'Retry-After': '1'})
+        except RenderTimeout:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail='Plot rendering timed out',
+                                headers={'Retry-After': '5'})
+        except BrokenProcessPool:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail='Plot renderer restarting',
+                                headers={'Retry-After': '1'})
+        if png is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Plot not available')
+        insights.remember_plot(key, png)
+    return Response(content=png, media_type='image/png', headers={'ETag': etag, 'Cache-Control': 'no-cache'})
 
 
 @app.get('/api/recommendations')
@@ -145,7 +434,45 @@ def get_recommendations(risk_level: str = 'MODERADO'):
     return insights.get_recommendations_for_risk(risk_level)
 
 
+@app.get('/api/insights/timeseries')
+def insights_timeseries(granularity: str = 'day',
+                        start: Optional[datetime] = None,
+                        end: Optional[datetime] = None,
+                        handle: Optional[str] = None):
+    """Per-day or per-hour rollups of mood and the extended fields.
+
+    Only the buckets between ``start`` and ``end`` are read; pass ``handle``
+    for one user's series instead of the overall one.
+    """
+    try:
+        buckets = entry_store.aggregates.timeseries(granularity, _local_naive(start), _local_naive(end), handle)
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    return {
+        'granularity': granularity,
+        'handle': handle,
+        'buckets': [{'start': s.isoformat(), 'count': fields['mood']['count'], **fields} for s, fields in buckets],
+    }
+
+
 @app.get('/api/insights/correlations')
 def insights_correlations():
     """Get correlations between mood and extended fields"""
-    return insights.correlations()
+    return entry_store.aggregates.correlations()
+
+
+@app.get('/metrics', include_in_schema=False)
+def prometheus_metrics():
+    """Request and storage metrics in the Prometheus text format"""
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get('/api/profiles/{name}', include_in_schema=False)
+def get_profile(name: str, x_profile: Optional[str] = Header(None)):
+    """Collapsed stacks of a profiled request (needs the profile token)"""
+    # 404 rather than 401/403: don't advertise the feature to others
+    path = profiling.profile_path(name) if config.PROFILING and profiling.authorized(x_profile) else None
+    if path is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Not found')
+    with open(path, 'r', encoding='utf-8') as f:
+        return Response(content=f.read(), media_type='text/plain')
@@ -0,0 +1,276 @@
+"""
+Columnar snapshot of entries.csv for the analytics layer.
+
+compact() writes everything currently in entries.csv to a typed columnar
+file next to it (Parquet through pyarrow when it is installed, a pandas
+pickle otherwise) plus a small JSON sidecar recording how many bytes of
+the CSV it covers. load_entries() reads the snapshot back and parses only
+the rows appended to the CSV since, so a reload costs one columnar read
+plus the tail instead of a full text parse. A snapshot whose covered
+prefix no longer matches the CSV (rewritten by a migration, edited by
+hand) is ignored until the next compaction.
+"""
+import hashlib
+import io
+import json
+import os
+import threading
+
+from . import config
+from .lazy import pd, available
+from .metrics import record_io
+from .storage import ENTRIES, _FileLock, _shared
+
+# Column types for entries.csv; parsing with them skips pandas' type sniffing.
+# Scores are read as float64 so blank optional fields can be NaN, then
+# narrowed by typed_frame().
+ENTRY_DTYPES = {
+    'id': 'int64',
+    'account_id': 'int64',
+    'handle': 'str',
+    'mood': 'float64',
+    'comment': 'str',
+    'sleep_hours': 'float64',
+    'appetite': 'float64',
+    'concentration': 'float64',
+    'created': 'str',
+}
+
+# 1-10 scores fit a nullable int8; blanks stay <NA>
+SCORE_COLUMNS = ('mood', 'appetite', 'concentration')
+
+# bytes of the CSV just before the covered offset, hashed to spot rewrites
+_CHECK_BYTES = 4096
+
+_COMPACT_LOCK = threading.Lock()
+
+
+def _meta_path(csv_path):
+    return os.path.splitext(csv_path)[0] + '.snapshot.json'
+
+
+def _score(s):
+    s = pd.to_numeric(s, errors='coerce')
+    valid = s.dropna()
+    # anything that isn't a small whole number keeps the float column
+    if len(valid) and ((valid % 1 != 0).any() or valid.abs().max() > 127):
+        return s
+    return s.astype('Int8')
+
+
+def typed_frame(df):
+    """Coerce a raw entries frame to the compact analytics dtypes.
+
+    id int64, account_id int32, scores Int8, sleep_hours float32,
+    handle categorical and created datetime64; unparseable values become
+    missing rather than failing the whole frame.
+    """
+    if 'created' in df.columns:
+        df['created'] = pd.to_datetime(df['created'], errors='coerce', format='ISO8601')
+    for col in SCORE_COLUMNS:
+        if col in df.columns:
+            df[col] = _score(df[col])
+    if 'sleep_hours' in df.columns:
+        df['sleep_hours'] = pd.to_numeric(df['sleep_hours'], errors='coerce').astype('float32')
+    if 'account_id' in df.columns and pd.api.types.is_integer_dtype(df['account_id']) \
+            and (df.empty or df['account_id'].abs().max() < 2 ** 31):
+        df['account_id'] = df['account_id'].astype('int32')
+    if 'handle' in df.columns:
+        df['handle'] = df['handle'].astype('category')
+    return df
+
+
+def _complete(data, start=0):
+    # length of the prefix of ``data`` made of whole records: ends on a line
+    # break with balanced quotes, so a half-written append is left for later
+    end = len(data)
+    while end > start:
+        if data[end - 1:end] == b'\n' and data.count(b'"', start, end) % 2 == 0:
+            return end
+        end = data.rfind(b'\n', start, end - 1) + 1
+    return start
+
+
+def _parse_csv(data):
+    if not data.strip():
+        return pd.DataFrame()
+    try:
+        df = pd.read_csv(io.BytesIO(data), dtype=ENTRY_DTYPES)
+    except (ValueError, TypeError):
+        # a malformed row; fall back to inference and let coercion clean up
+        df = pd.read_csv(io.BytesIO(data))
+    return typed_frame(df)
+
+
+def _concat(head, tail):
+    if tail.empty:
+        return head
+    if head.empty:
+        return tail
+    handles = None
+    if 'handle' in head.columns and 'handle' in tail.columns:
+        handles = pd.api.types.union_categoricals([head['handle'].astype('category'), tail['handle'].astype('category')])
+        head, tail = head.drop(columns='handle'), tail.drop(columns='handle')
+    df = pd.concat([head, tail], ignore_index=True)
+    if handles is not None:
+        df['handle'] = handles
+    return df
+
+
+def _check(f, offset):
+    # hash of the CSV bytes just before ``offset``
+    start = max(0, offset - _CHECK_BYTES)
+    f.seek(start)
+    return hashlib.sha1(f.read(offset - start)).hexdigest()
+
+
+def _read_meta(csv_path):
+    try:
+        with open(_meta_path(csv_path), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _read_snapshot(csv_path, meta, f):
+    """Snapshot frame if ``meta`` still describes a prefix of the open CSV ``f``."""
+    offset = meta.get('offset', 0)
+    f.seek(0, os.SEEK_END)
+    if f.tell() < offset:
+        return None
+    if _check(f, offset) != meta.get('check'):
+        return None
+    path = os.path.join(os.path.dirname(csv_path), meta['file'])
+    try:
+        if meta.get('format') == 'parquet':
+            if not available('pyarrow'):
+                return None
+            df = pd.read_parquet(path, engine='pyarrow')
+        else:
+            df = pd.read_pickle(path)
+        record_io('analytics', opens=1, nbytes=os.path.getsize(path))
+    except (OSError, ValueError):
+        # replaced by a newer compaction between reading the meta and the file
+        return None
+    return df
+
+
+def _load(csv_path):
+    # (frame, bytes of the CSV it covers, whether a snapshot was used)
+    if not os.path.exists(csv_path):
+        return pd.DataFrame(), 0, False
+    with open(csv_path, 'rb') as f:
+        meta = _read_meta(csv_path)
+        snap = _read_snapshot(csv_path, meta, f) if meta else None
+        if snap is None:
+            f.seek(0)
+            data = f.read()
+            end = _complete(data)
+            df = _parse_csv(data[:end])
+            record_io('analytics', opens=1, nbytes=len(data), rows=len(df))
+            return df, end, False
+        offset = meta['offset']
+        f.seek(0)
+        header = f.readline()
+        f.seek(offset)
+        tail = f.read()
+    end = _complete(tail)
+    fresh = _parse_csv(header + tail[:end]) if end else pd.DataFrame()
+    record_io('analytics', opens=1, nbytes=len(header) + len(tail), rows=len(fresh))
+    return _concat(snap, fresh), offset + end, True
+
+
+def load_entries(csv_path=ENTRIES):
+    """Typed entries frame: the snapshot plus the CSV tail, or the whole
+    CSV when there is no usable snapshot."""
+    return _load(csv_path)[0]
+
+
+def compact(csv_path=ENTRIES):
+    """
+    Write a fresh snapshot covering the CSV as it is now. Builds on the
+    previous snapshot, so only the new tail is parsed. Returns the new
+    metadata, or None when the snapshot was already current.
+    """
+    # the file lock keeps compactors in other server workers out as well
+    lock_path = os.path.splitext(csv_path)[0] + '.snapshot.lock'
+    with _COMPACT_LOCK, _shared('snapshot-lock', lock_path, lambda: _FileLock(lock_path)):
+        meta = _read_meta(csv_path)
+        df, offset, used = _load(csv_path)
+        if used and meta.get('offset') == offset:
+            return None
+        with open(csv_path, 'rb') as f:
+            check = _check(f, offset)
+        fmt = 'parquet' if available('pyarrow') else 'pickle'
+        base = os.path.splitext(os.path.basename(csv_path))[0]
+        # a new name per snapshot: readers holding the old metadata can
+        # still open the file it points at until it is removed below
+        name = f'{base}.snapshot-{offset}.{fmt}'
+        directory = os.path.dirname(csv_path)
+        path = os.path.join(directory, name)
+        tmp = path + '.tmp'
+        if fmt == 'parquet':
+            df.to_parquet(tmp, engine='pyarrow', index=False)
+        else:
+            df.to_pickle(tmp)
+        os.replace(tmp, path)
+        new_meta = {'file': name, 'format': fmt, 'offset': offset, 'rows': int(df.shape[0]), 'check': check}
+        tmp = _meta_path(csv_path) + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(new_meta, f)
+        os.replace(tmp, _meta_path(csv_path))
+        if meta and meta.get('file') and meta['file'] != name:
+            try:
+                os.remove(os.path.join(directory, meta['file']))
+            except OSError:
+                pass
+        return new_meta
+
+
+def invalidate(csv_path=ENTRIES):
+    """Drop the snapshot of a CSV that was rewritten; the analytics read
+    the whole CSV again until the next compaction."""
+    lock_path = os.path.splitext(csv_path)[0] + '.snapshot.lock'
+    with _COMPACT_LOCK, _shared('snapshot-lock', lock_path, lambda: _FileLock(lock_path)):
+        meta = _read_meta(csv_path) or {}
+        paths = [_meta_path(csv_path)]
+        if meta.get('file'):
+            paths.append(os.path.join(os.path.dirname(csv_path), meta['file']))
+        # metadata first: a reader never finds it pointing at a missing file
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class Compactor:
+    """Background thread that re-runs compact() every ``interval`` seconds."""
+
+    def __init__(self, csv_path=ENTRIES, interval=None):
+        self.csv_path = csv_path
+        self.interval = config.SNAPSHOT_INTERVAL if interval is None else interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='entries-compactor', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        if not available('pandas'):
+            return
+        while not self._stop.wait(self.interval):
+            try:
+                compact(self.csv_path)
+            except Exception:
+                # keep serving from the CSV; the next round tries again
+                continue
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
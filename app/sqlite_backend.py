@@ -0,0 +1,240 @@
+"""
+SQLite storage engine for MoodKeeper.
+
+Enabled with MOODKEEPER_STORAGE=sqlite. The database runs in WAL mode so
+readers never block the writer, and every query is a fixed, parameterised
+statement so sqlite3's per-connection statement cache keeps it compiled.
+Connections are per thread (FastAPI runs sync endpoints in a threadpool).
+"""
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from .storage import (
+    AccountBackend, EntryBackend, AccountRecord, EntryRecord,
+    CsvAccountBackend, CsvEntryBackend, ACCOUNTS, ENTRIES,
+)
+
+SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS accounts (
+        id INTEGER PRIMARY KEY,
+        handle TEXT NOT NULL,
+        email TEXT,
+        hashed TEXT NOT NULL,
+        created TEXT NOT NULL
+    )''',
+    'CREATE INDEX IF NOT EXISTS idx_accounts_handle ON accounts(handle)',
+    '''CREATE TABLE IF NOT EXISTS entries (
+        id INTEGER PRIMARY KEY,
+        account_id INTEGER NOT NULL,
+        handle TEXT NOT NULL,
+        mood INTEGER NOT NULL,
+        comment TEXT,
+        sleep_hours REAL,
+        appetite INTEGER,
+        concentration INTEGER,
+        created TEXT NOT NULL
+    )''',
+    'CREATE INDEX IF NOT EXISTS idx_entries_handle ON entries(handle)',
+    'CREATE INDEX IF NOT EXISTS idx_entries_account_id ON entries(account_id)',
+    'CREATE INDEX IF NOT EXISTS idx_entries_created ON entries(created)',
+)
+
+ACCOUNT_COLUMNS = 'id, handle, email, hashed, created'
+ENTRY_COLUMNS = 'id, account_id, handle, mood, comment, sleep_hours, appetite, concentration, created'
+
+INSERT_ACCOUNT = 'INSERT INTO accounts (handle, email, hashed, created) VALUES (?, ?, ?, ?)'
+IMPORT_ACCOUNT = f'INSERT OR IGNORE INTO accounts ({ACCOUNT_COLUMNS}) VALUES (?, ?, ?, ?, ?)'
+SELECT_ACCOUNT_BY_HANDLE = f'SELECT {ACCOUNT_COLUMNS} FROM accounts WHERE handle = ? ORDER BY id LIMIT 1'
+SELECT_ACCOUNTS = f'SELECT {ACCOUNT_COLUMNS} FROM accounts ORDER BY id'
+
+INSERT_ENTRY = ('INSERT INTO entries (account_id, handle, mood, comment, sleep_hours, appetite, concentration, created) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)')
+INSERT_ENTRY_BLOCK = f'INSERT INTO entries ({ENTRY_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'
+IMPORT_ENTRY = f'INSERT OR IGNORE INTO entries ({ENTRY_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'
+SELECT_ENTRIES = f'SELECT {ENTRY_COLUMNS} FROM entries ORDER BY id'
+SELECT_ENTRY_BY_ID = f'SELECT {ENTRY_COLUMNS} FROM entries WHERE id = ?'
+SELECT_MAX_ENTRY_ID = 'SELECT COALESCE(MAX(id), 0) FROM entries'
+
+
+class _Database:
+    """Owns the schema and hands out one connection per thread."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self.conn()
+        with conn:
+            for stmt in SCHEMA:
+                conn.execute(stmt)
+
+    def conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def version(self):
+        # one file holds every table, so this moves on any write
+        key = []
+        for path in (self.path, self.path + '-wal'):
+            try:
+                st = os.stat(path)
+                key.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                key.append(None)
+        return tuple(key)
+
+
+_DATABASES = {}
+_DATABASES_LOCK = threading.Lock()
+
+
+def _database(path):
+    with _DATABASES_LOCK:
+        if path not in _DATABASES:
+            _DATABASES[path] = _Database(path)
+        return _DATABASES[path]
+
+
+def _account(row):
+    return AccountRecord(id=row[0], handle=row[1], email=row[2], hashed=row[3], created=datetime.fromisoformat(row[4]))
+
+
+def _entry(row):
+    return EntryRecord(id=row[0], account_id=row[1], handle=row[2], mood=row[3], comment=row[4] or None,
+                       sleep_hours=row[5], appetite=row[6], concentration=row[7],
+                       created=datetime.fromisoformat(row[8]))
+
+
+class SqliteAccountBackend(AccountBackend):
+    def __init__(self, path):
+        self.db = _database(path)
+
+    def create(self, handle, email, hashed):
+        now = datetime.now().isoformat()
+        conn = self.db.conn()
+        with conn:
+            cur = conn.execute(INSERT_ACCOUNT, (handle, email, hashed, now))
+        return AccountRecord(id=cur.lastrowid, handle=handle, email=email, hashed=hashed, created=datetime.fromisoformat(now))
+
+    def find_by_handle(self, handle):
+        row = self.db.conn().execute(SELECT_ACCOUNT_BY_HANDLE, (handle,)).fetchone()
+        return _account(row) if row else None
+
+    def iter_all(self):
+        for row in self.db.conn().execute(SELECT_ACCOUNTS):
+            yield _account(row)
+
+    def version(self):
+        return self.db.version()
+
+
+class SqliteEntryBackend(EntryBackend):
+    def __init__(self, path):
+        self.db = _database(path)
+
+    def create(self, account_id, handle, mood, comment, sleep_hours=None, appetite=None, concentration=None):
+        now = datetime.now().isoformat()
+        conn = self.db.conn()
+        with conn:
+            cur = conn.execute(INSERT_ENTRY, (account_id, handle, mood, comment, sleep_hours, appetite, concentration, now))
+        return EntryRecord(id=cur.lastrowid, account_id=account_id, handle=handle, mood=mood, comment=comment,
+                           sleep_hours=sleep_hours, appetite=appetite, concentration=concentration,
+                           created=datetime.fromisoformat(now))
+
+    def create_many(self, rows):
+        rows = list(rows)
+        if not rows:
+            return []
+        now = datetime.now().isoformat()
+        conn = self.db.conn()
+        with conn:
+            # take the write lock before reading max(id) so the block stays ours
+            conn.execute('BEGIN IMMEDIATE')
+            first = conn.execute(SELECT_MAX_ENTRY_ID).fetchone()[0] + 1
+            conn.executemany(INSERT_ENTRY_BLOCK, (
+                (first + n, *row, now) for n, row in enumerate(rows)
+            ))
+        created = datetime.fromisoformat(now)
+        return [EntryRecord(id=first + n, account_id=a, handle=h, mood=m, comment=c, sleep_hours=s, appetite=ap,
+                            concentration=co, created=created)
+                for n, (a, h, m, c, s, ap, co) in enumerate(rows)]
+
+    def list_all(self):
+        return [_entry(row) for row in self.db.conn().execute(SELECT_ENTRIES)]
+
+    def version(self):
+        return self.db.version()
+
+    def iter_entries(self, after_id=None, limit=None, handle=None, account_id=None, created_from=None, created_to=None):
+        if limit is not None and limit <= 0:
+            return
+        # only a handful of fixed clause combinations exist, so each one
+        # still lands in the connection's statement cache
+        where, params = [], []
+        if after_id is not None:
+            where.append('id > ?')
+            params.append(after_id)
+        if handle is not None:
+            where.append('handle = ?')
+            params.append(handle)
+        if account_id is not None:
+            where.append('account_id = ?')
+            params.append(account_id)
+        if created_from is not None:
+            where.append('created >= ?')
+            params.append(created_from.isoformat())
+        if created_to is not None:
+            where.append('created <= ?')
+            params.append(created_to.isoformat())
+        sql = f'SELECT {ENTRY_COLUMNS} FROM entries'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY id'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        for row in self.db.conn().execute(sql, params):
+            yield _entry(row)
+
+    def get_many(self, ids):
+        conn = self.db.conn()
+        found = {}
+        for eid in sorted(set(ids)):
+            row = conn.execute(SELECT_ENTRY_BY_ID, (eid,)).fetchone()
+            if row:
+                found[eid] = _entry(row)
+        return [found.get(i) for i in ids]
+
+
+def import_csv(db_path, accounts_csv=ACCOUNTS, entries_csv=ENTRIES):
+    """
+    One-shot copy of the CSV files into a SQLite database.
+    Ids are preserved; rows whose id already exists are skipped, so the
+    import can be re-run safely.
+
+    Returns:
+        (accounts imported, entries imported)
+    """
+    conn = _database(db_path).conn()
+    accounts = CsvAccountBackend(accounts_csv).iter_all()
+    entries = CsvEntryBackend(entries_csv).iter_entries()
+    with conn:
+        before = conn.total_changes
+        conn.executemany(IMPORT_ACCOUNT, (
+            (a.id, a.handle, a.email, a.hashed, a.created.isoformat()) for a in accounts
+        ))
+        n_accounts = conn.total_changes - before
+        before = conn.total_changes
+        conn.executemany(IMPORT_ENTRY, (
+            (e.id, e.account_id, e.handle, e.mood, e.comment, e.sleep_hours, e.appetite, e.concentration,
+             e.created.isoformat()) for e in entries
+        ))
+        n_entries = conn.total_changes - before
+    return n_accounts, n_entries
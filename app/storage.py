@@ -1,11 +1,25 @@
+import atexit
 import os
+import io
 import csv
+import threading
+import time
+from concurrent.futures import Future
 from dataclasses import dataclass
 from datetime import datetime
 from typing import Optional, List
 
+try:
+    import fcntl
+except ImportError:
+    # no flock (Windows): the CSV files must have a single writing process
+    fcntl = None
+
+from . import config
+from .metrics import record_io
+
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-DATA = os.path.join(ROOT, 'data')
+DATA = config.DATA_DIR
 ACCOUNTS = os.path.join(DATA, 'accounts.csv')
 ENTRIES = os.path.join(DATA, 'entries.csv')
 
@@ -13,25 +27,231 @@ ENTRIES = os.path.join(DATA, 'entries.csv')
 def _ensure(path, headers):
     os.makedirs(os.path.dirname(path), exist_ok=True)
     if not os.path.exists(path):
-        with open(path, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow(headers)
+        try:
+            # 'x': when several workers start at once only one writes the header
+            with open(path, 'x', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(headers)
+        except FileExistsError:
+            pass
+
 
+def _store(path):
+    # metrics label for a data file: 'accounts', 'entries'
+    return os.path.splitext(os.path.basename(path))[0]
 
-def _next_id(path):
+
+def _max_id(path, start=0):
+    # (highest id among the records from byte ``start`` on, offset scanned to);
+    # the header row and malformed rows don't parse and are skipped
+    maxid = rows = 0
     if not os.path.exists(path):
-        return 1
-    with open(path, 'r', newline='', encoding='utf-8') as f:
-        r = csv.DictReader(f)
-        maxid = 0
-        for row in r:
+        return maxid, 0
+    with open(path, 'rb') as f:
+        for _, raw in _iter_records(f, start):
+            rows += 1
             try:
-                v = int(row.get('id', 0))
-                if v > maxid:
-                    maxid = v
-            except Exception:
+                maxid = max(maxid, int(_parse_record(raw)[0]))
+            except (ValueError, IndexError):
                 continue
-    return maxid + 1
+        end = f.tell()
+    record_io(_store(path), opens=1, nbytes=end - start, rows=rows)
+    return maxid, end
+
+
+def _signature(path):
+    # cheap change detector for files other processes/scripts may rewrite:
+    # (mtime, size, inode); the inode changes when a migration swaps in a
+    # new file, even if it happens to have the same size
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def _repair_tail(path):
+    # a crash in the middle of an append can leave a row without its line
+    # terminator; close it off so the next append starts on a fresh line
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return
+    with open(path, 'rb+') as f:
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) not in (b'\n', b'\r'):
+            f.write(b'\n')
+    record_io(_store(path), opens=1, nbytes=1)
+
+
+# True when appends are coordinated across processes, so several server
+# workers may share the CSV files
+FILE_LOCKS = fcntl is not None
+
+
+class _FileLock:
+    """Exclusive lock on a data file, across threads and processes.
+
+    Threads queue on an RLock; the holding thread then takes an flock on
+    ``path`` (a sidecar .lock file) so other processes wait as well.
+    Reentrant: only the outermost release drops the flock. Without fcntl
+    it is a plain RLock.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+        self._pid = None
+
+    def _file(self):
+        # a forked child must not share our open file description (and so
+        # our flock); give it its own
+        if self._fd is None or self._pid != os.getpid():
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._pid = os.getpid()
+        return self._fd
+
+    def acquire(self):
+        self._lock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            try:
+                fcntl.flock(self._file(), fcntl.LOCK_EX)
+            except BaseException:
+                self._lock.release()
+                raise
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0 and fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class _IdAllocator:
+    """In-memory id sequence for one CSV file.
+
+    The high-water mark is read from the file once, on first use; after that
+    an allocation is a counter bump. The CSV stays the source of truth, so a
+    restart after a crash re-reads the mark and never hands out an id that
+    already reached disk. Callers hold ``lock`` across allocate + append so
+    rows land in the file in id order; the lock is a _FileLock, so that
+    also holds with several processes appending. Rows another process
+    appended since our last write are scanned for their ids before the
+    next allocation.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = _FileLock(path + '.lock')
+        self._last = None
+        # bytes of the file whose ids are already accounted for, and which
+        # file that was (a replaced file is re-read from the start)
+        self._size = 0
+        self._ino = None
+
+    def _catch_up(self):
+        sig = _signature(self.path)
+        size, ino = (sig[1], sig[2]) if sig else (0, None)
+        if self._last is not None and size == self._size and ino == self._ino:
+            return
+        _repair_tail(self.path)
+        replaced, self._ino = ino != self._ino, ino
+        if self._last is None or replaced or size < self._size:
+            self._last, self._size = _max_id(self.path)
+        else:
+            # only what others appended past our mark
+            tail, self._size = _max_id(self.path, self._size)
+            self._last = max(self._last, tail)
+
+    def reserve(self, count=1):
+        """Return the first of ``count`` consecutive fresh ids."""
+        with self.lock:
+            self._catch_up()
+            first = self._last + 1
+            self._last += count
+            return first
+
+    def appended(self, size):
+        """Our reserved rows were written and the file now ends at ``size``."""
+        with self.lock:
+            if self._last is not None:
+                self._size = size
+
+    def resync(self):
+        """Forget the high-water mark; the next reserve re-reads it from disk."""
+        with self.lock:
+            self._last = None
+            self._size = 0
+            self._ino = None
+
+
+_SHARED = {}
+_SHARED_LOCK = threading.Lock()
+
+
+def _shared(kind, path, factory):
+    # one allocator/index per file, shared by every store instance in the process
+    with _SHARED_LOCK:
+        key = (kind, path)
+        if key not in _SHARED:
+            _SHARED[key] = factory()
+        return _SHARED[key]
+
+
+def close_writers():
+    """Flush every entries writer in this process.
+
+    Registered with atexit, so rows still queued when the interpreter
+    exits (no lifespan shutdown, e.g. a worker killed by its supervisor
+    after a SIGTERM) reach the file anyway.
+    """
+    with _SHARED_LOCK:
+        writers = [w for (kind, _), w in _SHARED.items() if kind == 'writer']
+    for w in writers:
+        w.close()
+
+
+atexit.register(close_writers)
+
+
+def _read_record(f, offset=None):
+    # read one CSV record from a binary file; quoted fields may span lines,
+    # so keep reading until the quotes balance
+    if offset is not None:
+        f.seek(offset)
+    raw = b''
+    while True:
+        line = f.readline()
+        if not line:
+            break
+        raw += line
+        if raw.count(b'"') % 2 == 0:
+            break
+    return raw
+
+
+def _iter_records(f, start=0):
+    # yield (offset, raw bytes) for every record from ``start`` to EOF
+    f.seek(start)
+    pos = start
+    while True:
+        raw = _read_record(f)
+        if not raw:
+            return
+        yield pos, raw
+        pos += len(raw)
+
+
+def _parse_record(raw):
+    return next(csv.reader(io.StringIO(raw.decode('utf-8'))), [])
 
 
 @dataclass
@@ -43,34 +263,112 @@ class AccountRecord:
     created: datetime
 
 
-class AccountStore:
-    def __init__(self):
-        _ensure(ACCOUNTS, ['id','handle','email','hashed','created'])
+class _HandleIndex:
+    """handle -> AccountRecord map for one accounts file.
+
+    Built on first lookup, extended in place by our own appends and thrown
+    away whenever the file's mtime or size stops matching what we last saw
+    (manual edits, scripts, another process).
+    """
+
+    def __init__(self, path, load):
+        self.path = path
+        self._load = load
+        self._lock = threading.Lock()
+        self._by_handle = None
+        self._sig = None
+
+    def _fresh(self):
+        sig = _signature(self.path)
+        if self._by_handle is None or sig != self._sig:
+            by_handle = {}
+            for a in self._load():
+                # first row wins, same as the old linear scan
+                by_handle.setdefault(a.handle, a)
+            self._by_handle = by_handle
+            self._sig = sig
+        return self._by_handle
+
+    def get(self, handle):
+        with self._lock:
+            return self._fresh().get(handle)
+
+    def add(self, record, sig_before):
+        """Record an append we made; ``sig_before`` is the stat taken just before it."""
+        with self._lock:
+            if self._by_handle is None or sig_before != self._sig:
+                # someone else touched the file as well; rebuild on next lookup
+                self._by_handle = None
+                return
+            self._by_handle.setdefault(record.handle, record)
+            self._sig = _signature(self.path)
+
+
+class AccountBackend:
+    """Persistence contract behind AccountStore.
+
+    Implemented by CsvAccountBackend (the default) and by
+    ``app.sqlite_backend.SqliteAccountBackend``.
+    """
+
+    def create(self, handle, email, hashed):
+        raise NotImplementedError
+
+    def find_by_handle(self, handle):
+        raise NotImplementedError
+
+    def iter_all(self):
+        raise NotImplementedError
+
+    def version(self):
+        """Opaque token that changes whenever the stored accounts change."""
+        raise NotImplementedError
+
+
+class CsvAccountBackend(AccountBackend):
+    def __init__(self, path=ACCOUNTS):
+        self.path = path
+        _ensure(path, ['id','handle','email','hashed','created'])
+        self._ids = _shared('ids', path, lambda: _IdAllocator(path))
+        self._index = _shared('handles', path, lambda: _HandleIndex(path, self.iter_all))
 
     def create(self, handle, email, hashed):
-        aid = _next_id(ACCOUNTS)
         now = datetime.now().isoformat()
-        with open(ACCOUNTS, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow([aid, handle, email, hashed, now])
-        return AccountRecord(id=aid, handle=handle, email=email, hashed=hashed, created=datetime.fromisoformat(now))
+        with self._ids.lock:
+            aid = self._ids.reserve()
+            sig_before = _signature(self.path)
+            with open(self.path, 'a', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow([aid, handle, email, hashed, now])
+                f.flush()
+                self._ids.appended(f.tell())
+            record_io(_store(self.path), opens=1)
+            record = AccountRecord(id=aid, handle=handle, email=email, hashed=hashed, created=datetime.fromisoformat(now))
+            self._index.add(record, sig_before)
+        return record
 
-    def _iter(self):
-        if not os.path.exists(ACCOUNTS):
+    def iter_all(self):
+        if not os.path.exists(self.path):
             return
-        with open(ACCOUNTS, 'r', newline='', encoding='utf-8') as f:
+        with open(self.path, 'r', newline='', encoding='utf-8') as f:
+            size = os.fstat(f.fileno()).st_size
+            rows = 0
             r = csv.DictReader(f)
-            for row in r:
-                try:
-                    yield AccountRecord(id=int(row.get('id',0)), handle=row.get('handle'), email=row.get('email'), hashed=row.get('hashed'), created=datetime.fromisoformat(row.get('created')))    
-                except Exception:
-                    continue
+            try:
+                for row in r:
+                    rows += 1
+                    try:
+                        yield AccountRecord(id=int(row.get('id',0)), handle=row.get('handle'), email=row.get('email'), hashed=row.get('hashed'), created=datetime.fromisoformat(row.get('created')))    
+                    except Exception:
+                        continue
+            finally:
+                record_io(_store(self.path), opens=1, nbytes=size, rows=rows)
 
     def find_by_handle(self, handle):
-        for a in self._iter():
-            if a.handle == handle:
-                return a
-        return None
+        return self._index.get(handle)
+
+    def version(self):
+        return _signature(self.path)
 
 
 @dataclass
@@ -86,46 +384,481 @@ class EntryRecord:
     created: datetime
 
 
-class EntryStore:
-    def __init__(self):
-        _ensure(ENTRIES, ['id','account_id','handle','mood','comment','sleep_hours','appetite','concentration','created'])
+def _entry_from_row(row):
+    sleep_hours = float(row.get('sleep_hours')) if row.get('sleep_hours') else None
+    appetite = int(row.get('appetite')) if row.get('appetite') else None
+    concentration = int(row.get('concentration')) if row.get('concentration') else None
+    return EntryRecord(
+        id=int(row.get('id',0)), 
+        account_id=int(row.get('account_id',0)), 
+        handle=row.get('handle'), 
+        mood=int(row.get('mood',0)), 
+        comment=row.get('comment') or None, 
+        sleep_hours=sleep_hours,
+        appetite=appetite,
+        concentration=concentration,
+        created=datetime.fromisoformat(row.get('created'))
+    )
+
+
+class _OffsetIndex:
+    """id -> byte offset of the row in the entries file.
+
+    Our own appends are added as they happen; anything else that changes the
+    file is picked up on the next lookup, by indexing only the new tail when
+    the file grew and by a full rebuild otherwise.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._offsets = {}
+        self._fields = None
+        self._size = 0
+        self._sig = None
+
+    def _scan(self, start):
+        rows = 0
+        with open(self.path, 'rb') as f:
+            for offset, raw in _iter_records(f, start):
+                rows += 1
+                row = _parse_record(raw)
+                if offset == 0:
+                    self._fields = row
+                    continue
+                try:
+                    self._offsets.setdefault(int(row[0]), offset)
+                except (ValueError, IndexError):
+                    continue
+            self._size = f.tell()
+        record_io(_store(self.path), opens=1, nbytes=self._size - start, rows=rows)
+
+    def _fresh(self):
+        sig = _signature(self.path)
+        if sig == self._sig:
+            return
+        if sig is None:
+            self._offsets, self._fields, self._size = {}, None, 0
+        elif self._sig is not None and sig[2] == self._sig[2] and sig[1] > self._size:
+            self._scan(self._size)
+        else:
+            self._offsets, self._fields = {}, None
+            self._scan(0)
+        self._sig = sig
+
+    def rebuild(self):
+        with self._lock:
+            self._sig = None
+            self._size = 0
+            self._fresh()
+
+    def lookup(self, ids):
+        """Return (header fields, {id: offset}) for the ids that exist."""
+        with self._lock:
+            self._fresh()
+            found = {i: self._offsets[i] for i in ids if i in self._offsets}
+            return self._fields, found
+
+    def seek_point(self, after_id=None):
+        """Return (header fields, offset to start reading from for ids > after_id)."""
+        with self._lock:
+            self._fresh()
+            return self._fields, self._offsets.get(after_id, 0)
+
+    def add(self, eid, offset, sig_before):
+        self.add_many([(eid, offset)], sig_before)
+
+    def add_many(self, placed, sig_before):
+        """Record rows we appended; ``placed`` is [(id, offset)] in file order."""
+        with self._lock:
+            if not placed or sig_before != self._sig or placed[0][1] != self._size:
+                # the file moved under us; let the next lookup catch up
+                return
+            for eid, offset in placed:
+                self._offsets.setdefault(eid, offset)
+            self._sig = _signature(self.path)
+            self._size = self._sig[1]
+
+
+class _GroupWriter:
+    """Single appender for one entries file, committing rows in groups.
+
+    Callers queue rows and get a Future; one background thread takes
+    whatever has queued up (about ``max_batch`` rows at most), assigns
+    the ids, writes the whole group with one open and one write,
+    optionally fsyncs, and only then resolves the futures with the stored
+    records. Rows submitted together
+    are never split, so they get consecutive ids. A lone submission is
+    written right away; only when several writers are already queued
+    does the thread wait up to ``interval`` seconds for more to join.
+    """
+
+    def __init__(self, path, ids, offsets, interval=None, max_batch=None, fsync=None):
+        self.path = path
+        self._ids = ids
+        self._offsets = offsets
+        self.interval = config.ENTRY_FLUSH_INTERVAL if interval is None else interval
+        self.max_batch = max(1, max_batch or config.ENTRY_MAX_BATCH)
+        self.fsync = config.ENTRY_FSYNC if fsync is None else fsync
+        self._cond = threading.Condition()
+        self._pending = []
+        self._queued = 0
+        self._thread = None
+        self._closing = False
+
+    def submit_many(self, rows):
+        """Queue rows to be written back to back; resolves to their EntryRecords."""
+        future = Future()
+        rows = list(rows)
+        if not rows:
+            future.set_result([])
+            return future
+        with self._cond:
+            while self._closing:
+                self._cond.wait()
+            # stamped under the queue lock so created follows id order
+            created = datetime.now()
+            self._pending.append((rows, created, future))
+            self._queued += len(rows)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='entries-writer', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return future
+
+    def _take(self):
+        with self._cond:
+            while not self._pending and not self._closing:
+                self._cond.wait()
+            # one writer and nobody else waiting: nothing to group with
+            if self.interval > 0 and not self._closing and len(self._pending) > 1:
+                deadline = time.monotonic() + self.interval
+                while self._queued < self.max_batch and not self._closing:
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        break
+                    self._cond.wait(left)
+            # whole submissions only; the first one goes even if it's oversized
+            n = rows = 0
+            while n < len(self._pending) and (n == 0 or rows + len(self._pending[n][0]) <= self.max_batch):
+                rows += len(self._pending[n][0])
+                n += 1
+            batch = self._pending[:n]
+            del self._pending[:n]
+            self._queued -= rows
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take()
+            if not batch:
+                return
+            try:
+                records = self._commit(batch)
+            except BaseException as exc:
+                for _, _, future in batch:
+                    future.set_exception(exc)
+                continue
+            for (_, _, future), group in zip(batch, records):
+                future.set_result(group)
+
+    def _commit(self, batch):
+        with self._ids.lock:
+            first = self._ids.reserve(sum(len(rows) for rows, _, _ in batch))
+            eid = first - 1
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            chunks, groups = [], []
+            for rows, created, _ in batch:
+                group = []
+                for account_id, handle, mood, comment, sleep_hours, appetite, concentration in rows:
+                    eid += 1
+                    writer.writerow([eid, account_id, handle, mood, comment or '', sleep_hours or '', appetite or '',
+                                     concentration or '', created.isoformat()])
+                    chunks.append(buf.getvalue().encode('utf-8'))
+                    buf.seek(0)
+                    buf.truncate()
+                    group.append(EntryRecord(id=eid, account_id=account_id, handle=handle, mood=mood, comment=comment,
+                                             sleep_hours=sleep_hours, appetite=appetite, concentration=concentration,
+                                             created=created))
+                groups.append(group)
+            sig_before = _signature(self.path)
+            try:
+                with open(self.path, 'ab') as f:
+                    f.write(b''.join(chunks))
+                    if self.fsync:
+                        f.flush()
+                        os.fsync(f.fileno())
+                    self._ids.appended(f.tell())
+                record_io(_store(self.path), opens=1)
+            except BaseException:
+                # ids may or may not have reached disk; re-read the mark
+                self._ids.resync()
+                raise
+            placed, offset = [], sig_before[1]
+            for n, chunk in enumerate(chunks):
+                placed.append((first + n, offset))
+                offset += len(chunk)
+            self._offsets.add_many(placed, sig_before)
+        return groups
+
+    def close(self):
+        """Flush everything queued so far and stop the writer thread.
+
+        A later submit simply starts a new one.
+        """
+        with self._cond:
+            self._closing = True
+            thread = self._thread
+            self._cond.notify_all()
+        if thread is not None:
+            thread.join()
+        with self._cond:
+            self._closing = False
+            self._thread = None
+            self._cond.notify_all()
+
+
+class EntryBackend:
+    """Persistence contract behind EntryStore.
+
+    Implemented by CsvEntryBackend (the default) and by
+    ``app.sqlite_backend.SqliteEntryBackend``.
+    """
 
     def create(self, account_id, handle, mood, comment, sleep_hours=None, appetite=None, concentration=None):
-        eid = _next_id(ENTRIES)
-        now = datetime.now().isoformat()
-        with open(ENTRIES, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow([eid, account_id, handle, mood, comment or '', sleep_hours or '', appetite or '', concentration or '', now])
-        return EntryRecord(id=eid, account_id=account_id, handle=handle, mood=mood, comment=comment, sleep_hours=sleep_hours, appetite=appetite, concentration=concentration, created=datetime.fromisoformat(now))
+        raise NotImplementedError
+
+    def create_many(self, rows):
+        """Store several entries at once under consecutive ids.
+
+        ``rows`` are (account_id, handle, mood, comment, sleep_hours,
+        appetite, concentration) tuples; returns their EntryRecords in order.
+        """
+        raise NotImplementedError
+
+    def list_all(self):
+        raise NotImplementedError
+
+    def get_many(self, ids):
+        """Return a list aligned with ``ids``; missing ids map to None."""
+        raise NotImplementedError
+
+    def version(self):
+        """Opaque token that changes whenever the stored entries change."""
+        raise NotImplementedError
+
+    def iter_entries(self, after_id=None, limit=None, handle=None, account_id=None, created_from=None, created_to=None):
+        """Yield matching entries in id order, lazily.
+
+        ``after_id`` is an exclusive cursor; ``created_from``/``created_to``
+        are inclusive bounds on ``created``.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Finish any buffered writes."""
+
+
+def _matches(e, after_id, account_id, created_from, created_to):
+    if after_id is not None and e.id <= after_id:
+        return False
+    if account_id is not None and e.account_id != account_id:
+        return False
+    if created_from is not None and e.created < created_from:
+        return False
+    if created_to is not None and e.created > created_to:
+        return False
+    return True
+
+
+class CsvEntryBackend(EntryBackend):
+    def __init__(self, path=ENTRIES):
+        self.path = path
+        _ensure(path, ['id','account_id','handle','mood','comment','sleep_hours','appetite','concentration','created'])
+        self._ids = _shared('ids', path, lambda: _IdAllocator(path))
+        self._offsets = _shared('offsets', path, lambda: _OffsetIndex(path))
+        self._writer = _shared('writer', path, lambda: _GroupWriter(path, self._ids, self._offsets))
+
+    def create(self, account_id, handle, mood, comment, sleep_hours=None, appetite=None, concentration=None):
+        # returns once the group holding this row is on disk
+        row = (account_id, handle, mood, comment, sleep_hours, appetite, concentration)
+        return self._writer.submit_many([row]).result()[0]
+
+    def create_many(self, rows):
+        # one queued group: one id block, one append
+        return self._writer.submit_many(rows).result()
+
+    def close(self):
+        self._writer.close()
 
     def list_all(self):
         items = []
-        if not os.path.exists(ENTRIES):
+        if not os.path.exists(self.path):
             return items
-        with open(ENTRIES, 'r', newline='', encoding='utf-8') as f:
+        with open(self.path, 'r', newline='', encoding='utf-8') as f:
+            size = os.fstat(f.fileno()).st_size
+            rows = 0
             r = csv.DictReader(f)
             for row in r:
+                rows += 1
                 try:
-                    sleep_hours = float(row.get('sleep_hours')) if row.get('sleep_hours') else None
-                    appetite = int(row.get('appetite')) if row.get('appetite') else None
-                    concentration = int(row.get('concentration')) if row.get('concentration') else None
-                    items.append(EntryRecord(
-                        id=int(row.get('id',0)), 
-                        account_id=int(row.get('account_id',0)), 
-                        handle=row.get('handle'), 
-                        mood=int(row.get('mood',0)), 
-                        comment=row.get('comment') or None, 
-                        sleep_hours=sleep_hours,
-                        appetite=appetite,
-                        concentration=concentration,
-                        created=datetime.fromisoformat(row.get('created'))
-                    ))
+                    items.append(_entry_from_row(row))
                 except Exception:
                     continue
+        record_io(_store(self.path), opens=1, nbytes=size, rows=rows)
         return items
 
+    def get_many(self, ids):
+        """Fetch several entries with one pass over the file.
+
+        Offsets are visited in ascending order so the reads move forward
+        through the file. Returns a list aligned with ``ids``; ids that do
+        not exist map to None.
+        """
+        ids = list(ids)
+        found = self._read(ids)
+        if any(rec is None or rec.id != i for i, rec in found.items()):
+            # offsets went stale (file rewritten in place); rebuild and retry
+            self._offsets.rebuild()
+            found = self._read(ids)
+        return [found.get(i) for i in ids]
+
+    def version(self):
+        return _signature(self.path)
+
+    def iter_entries(self, after_id=None, limit=None, handle=None, account_id=None, created_from=None, created_to=None):
+        if limit is not None and limit <= 0:
+            return
+        # start at the cursor row instead of the top of the file
+        fields, start = self._offsets.seek_point(after_id)
+        if not fields or not os.path.exists(self.path):
+            return
+        n = rows = 0
+        with open(self.path, 'rb') as raw:
+            raw.seek(start)
+            reader = csv.reader(io.TextIOWrapper(raw, encoding='utf-8', newline=''))
+            try:
+                if start == 0:
+                    next(reader, None)
+                for values in reader:
+                    rows += 1
+                    row = dict(zip(fields, values))
+                    if handle is not None and row.get('handle') != handle:
+                        continue
+                    try:
+                        e = _entry_from_row(row)
+                    except Exception:
+                        continue
+                    if not _matches(e, after_id, account_id, created_from, created_to):
+                        continue
+                    yield e
+                    n += 1
+                    if limit is not None and n >= limit:
+                        return
+            finally:
+                # bytes the text layer pulled in, read-ahead included
+                record_io(_store(self.path), opens=1, nbytes=raw.tell() - start, rows=rows)
+
+    def _read(self, ids):
+        fields, offsets = self._offsets.lookup(ids)
+        out = {}
+        if not offsets:
+            return out
+        nbytes = 0
+        with open(self.path, 'rb') as f:
+            for eid, offset in sorted(offsets.items(), key=lambda kv: kv[1]):
+                raw = _read_record(f, offset)
+                nbytes += len(raw)
+                try:
+                    out[eid] = _entry_from_row(dict(zip(fields, _parse_record(raw))))
+                except Exception:
+                    out[eid] = None
+        record_io(_store(self.path), opens=1, nbytes=nbytes, rows=len(offsets))
+        return out
+
+
+def _default_backend(kind):
+    # pick the engine configured through MOODKEEPER_STORAGE
+    engine = config.STORAGE_BACKEND
+    if engine == 'sqlite':
+        from .sqlite_backend import SqliteAccountBackend, SqliteEntryBackend
+        cls = SqliteAccountBackend if kind == 'accounts' else SqliteEntryBackend
+        return cls(config.SQLITE_PATH)
+    if engine == 'csv':
+        return CsvAccountBackend() if kind == 'accounts' else CsvEntryBackend()
+    raise ValueError(f'Unknown storage backend: {engine}')
+
+
+class AccountStore:
+    def __init__(self, backend=None):
+        self.backend = backend or _default_backend('accounts')
+
+    def create(self, handle, email, hashed):
+        return self.backend.create(handle, email, hashed)
+
+    def find_by_handle(self, handle):
+        return self.backend.find_by_handle(handle)
+
+    def version(self):
+        return self.backend.version()
+
+
+class EntryStore:
+    def __init__(self, backend=None, table=None):
+        from .aggregates import RunningAggregates
+        default = backend is None
+        self.backend = backend or _default_backend('entries')
+        self.aggregates = RunningAggregates(self.backend)
+        if table is None and default and config.ENTRY_TABLE:
+            from .entry_table import EntryTable
+            table = EntryTable(self.backend, config.ENTRY_TABLE_DIR)
+        self.table = table
+
+    def _table(self):
+        # the mapped table, caught up; None once it can't mirror the data
+        if self.table is None:
+            return None
+        try:
+            self.table.sync()
+        except (OverflowError, OSError):
+            self.table = None
+        return self.table
+
+    def create(self, account_id, handle, mood, comment, sleep_hours=None, appetite=None, concentration=None):
+        e = self.backend.create(account_id, handle, mood, comment, sleep_hours, appetite, concentration)
+        self.aggregates.add(e)
+        return e
+
+    def create_many(self, rows):
+        records = self.backend.create_many(rows)
+        for e in records:
+            self.aggregates.add(e)
+        return records
+
+    def list_all(self):
+        table = self._table()
+        if table is not None:
+            return table.rows()
+        return self.backend.list_all()
+
+    def close(self):
+        self.backend.close()
+
     def get(self, eid):
-        for e in self.list_all():
-            if e.id == eid:
-                return e
-        return None
+        return self.backend.get_many([eid])[0]
+
+    def get_many(self, ids):
+        return self.backend.get_many(ids)
+
+    def query(self, after_id=None, limit=None, handle=None, account_id=None, created_from=None, created_to=None):
+        """Lazily yield entries in id order, filtered in the backend.
+
+        Page through the table by passing the last id seen as ``after_id``.
+        """
+        table = self._table()
+        if table is not None:
+            return table.query(after_id=after_id, limit=limit, handle=handle, account_id=account_id,
+                               created_from=created_from, created_to=created_to)
+        return self.backend.iter_entries(after_id=after_id, limit=limit, handle=handle, account_id=account_id,
+                                         created_from=created_from, created_to=created_to)
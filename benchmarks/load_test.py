@@ -0,0 +1,286 @@
+"""
+HTTP load generator for the MoodKeeper API.
+
+Virtual users loop over a weighted mix of actions:
+
+  signup      POST /api/accounts
+  login       POST /api/sessions
+  entry       POST /api/entries with a bearer token
+  anon_entry  POST /api/entries without one
+  dashboard   what the dashboard page loads, fired concurrently: the
+              insights summary/average/alerts/correlations/timeseries,
+              the hist and ts plots, and the recommendations
+
+and every request's latency is recorded against its route. The report
+gives count, throughput, error rate and p50/p95/p99/max per route.
+
+By default the app runs in-process through httpx's ASGI transport against
+a throwaway data directory; --url drives a running server instead.
+
+    python benchmarks/load_test.py --users 32 --duration 30
+    python benchmarks/load_test.py --url http://127.0.0.1:8001 --mix entry=5,dashboard=1
+    python benchmarks/load_test.py --json after.json --compare before.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# relative weights of the actions a virtual user picks from
+MIX = {'signup': 1, 'login': 4, 'entry': 10, 'anon_entry': 3, 'dashboard': 2}
+
+DASHBOARD = (
+    '/api/insights/summary',
+    '/api/insights/average',
+    '/api/insights/alerts?threshold=3&days=30',
+    '/api/insights/correlations',
+    '/api/insights/timeseries?granularity=day',
+    '/api/insights/plot/hist',
+    '/api/insights/plot/ts',
+    '/api/recommendations?risk_level=MODERADO',
+)
+
+SECRET = 'password123'
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def parse_mix(text):
+    mix = dict(MIX)
+    if text:
+        for part in text.split(','):
+            name, _, weight = part.partition('=')
+            if name.strip() not in MIX:
+                raise SystemExit(f'unknown action {name!r}; choose from {", ".join(MIX)}')
+            mix[name.strip()] = float(weight)
+    return {k: v for k, v in mix.items() if v > 0}
+
+
+class Recorder:
+    """Latencies and status codes per route."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    async def call(self, client, route, method, url, **kwargs):
+        t = time.perf_counter()
+        try:
+            r = await client.request(method, url, **kwargs)
+            status = r.status_code
+        except Exception as exc:
+            r, status = None, type(exc).__name__
+        self.latencies[route].append(time.perf_counter() - t)
+        self.statuses[route][status] += 1
+        return r
+
+    def report(self, elapsed):
+        routes = {}
+        for route in sorted(self.latencies):
+            values = sorted(self.latencies[route])
+            statuses = self.statuses[route]
+            errors = sum(n for s, n in statuses.items() if not isinstance(s, int) or s >= 500)
+            routes[route] = {
+                'count': len(values),
+                'rps': len(values) / elapsed if elapsed else None,
+                'error_rate': errors / len(values),
+                'statuses': {str(s): n for s, n in sorted(statuses.items(), key=lambda kv: str(kv[0]))},
+                'mean_ms': sum(values) / len(values) * 1000,
+                'p50_ms': percentile(values, 50) * 1000,
+                'p95_ms': percentile(values, 95) * 1000,
+                'p99_ms': percentile(values, 99) * 1000,
+                'max_ms': values[-1] * 1000,
+            }
+        total = sum(r['count'] for r in routes.values())
+        return {'elapsed_s': elapsed, 'requests': total, 'rps': total / elapsed if elapsed else None,
+                'routes': routes}
+
+
+class VirtualUser:
+    def __init__(self, n, client, recorder, mix, rng, accounts):
+        self.n = n
+        self.client = client
+        self.rec = recorder
+        self.actions = list(mix)
+        self.weights = [mix[a] for a in self.actions]
+        self.rng = rng
+        # shared by every user: handles that exist, so logins can succeed
+        self.accounts = accounts
+        self.token = None
+        self.created = 0
+
+    async def signup(self):
+        self.created += 1
+        handle = f'load{os.getpid()}u{self.n}n{self.created}'
+        r = await self.rec.call(self.client, 'POST /api/accounts', 'POST', '/api/accounts',
+                                json={'handle': handle, 'email': f'{handle}@example.com', 'secret': SECRET})
+        if r is not None and r.status_code == 201:
+            self.accounts.append(handle)
+        return handle
+
+    async def login(self):
+        handle = self.rng.choice(self.accounts) if self.accounts else await self.signup()
+        r = await self.rec.call(self.client, 'POST /api/sessions', 'POST', '/api/sessions',
+                                json={'handle': handle, 'secret': SECRET})
+        if r is not None and r.status_code == 200:
+            self.token = r.json().get('access_token')
+
+    def _entry(self):
+        mood = self.rng.randint(1, 10)
+        body = {'mood': mood}
+        if self.rng.random() < 0.8:
+            body.update(sleep_hours=round(self.rng.uniform(3, 10), 1),
+                        appetite=self.rng.randint(1, 10), concentration=self.rng.randint(1, 10))
+        if self.rng.random() < 0.3:
+            body['comment'] = self.rng.choice(('Un día normal', 'Día difícil', 'Me siento genial'))
+        return body
+
+    async def entry(self):
+        if self.token is None:
+            await self.login()
+        headers = {'Authorization': f'Bearer {self.token}'} if self.token else {}
+        await self.rec.call(self.client, 'POST /api/entries (auth)', 'POST', '/api/entries',
+                            json=self._entry(), headers=headers)
+
+    async def anon_entry(self):
+        await self.rec.call(self.client, 'POST /api/entries (anon)', 'POST', '/api/entries', json=self._entry())
+
+    async def dashboard(self):
+        await asyncio.gather(*[
+            self.rec.call(self.client, 'GET ' + url.split('?')[0], 'GET', url) for url in DASHBOARD
+        ])
+
+    async def run(self, deadline, budget):
+        while time.perf_counter() < deadline and budget[0] > 0:
+            budget[0] -= 1
+            action = self.rng.choices(self.actions, self.weights)[0]
+            await getattr(self, action)()
+
+
+async def run(args, client):
+    recorder = Recorder()
+    accounts = []
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+    users = [VirtualUser(i, client, recorder, mix, random.Random(rng.random()), accounts)
+             for i in range(args.users)]
+    # a few accounts up front, so the first logins have someone to log in as
+    for u in users[:min(len(users), 4)]:
+        await u.signup()
+    recorder.latencies.clear()
+    recorder.statuses.clear()
+
+    start = time.perf_counter()
+    deadline = start + args.duration if args.duration else float('inf')
+    budget = [args.requests or float('inf')]
+    await asyncio.gather(*[u.run(deadline, budget) for u in users])
+    return recorder.report(time.perf_counter() - start)
+
+
+async def _in_process(args):
+    # the app reads its settings at import time, so point it at the data
+    # directory first: --data-dir, else the environment's, else a scratch one
+    scratch = None
+    if args.data_dir:
+        os.environ['MOODKEEPER_DATA_DIR'] = args.data_dir
+    elif 'MOODKEEPER_DATA_DIR' not in os.environ:
+        scratch = os.environ['MOODKEEPER_DATA_DIR'] = tempfile.mkdtemp(prefix='moodkeeper-load-')
+    os.environ.setdefault('MOODKEEPER_SNAPSHOT_INTERVAL', '0')
+    sys.path.insert(0, ROOT)
+    try:
+        import httpx
+        from app.server import app
+
+        await app.router.startup()
+        try:
+            # unhandled app errors come back as 500s, as they would from a server
+            transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+            async with httpx.AsyncClient(transport=transport, base_url='http://moodkeeper',
+                                         timeout=args.timeout) as client:
+                return await run(args, client)
+        finally:
+            await app.router.shutdown()
+    finally:
+        if scratch:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+
+async def _remote(args):
+    import httpx
+    limits = httpx.Limits(max_connections=args.users * len(DASHBOARD))
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        return await run(args, client)
+
+
+def print_report(report):
+    print(f"{report['requests']} requests in {report['elapsed_s']:.1f}s ({report['rps']:.1f} req/s)")
+    print(f'{"route":<42} {"count":>7} {"req/s":>8} {"err%":>6} {"p50":>8} {"p95":>8} {"p99":>8} {"max":>8}')
+    for route, r in report['routes'].items():
+        print(f"{route:<42} {r['count']:>7} {r['rps']:>8.1f} {r['error_rate'] * 100:>6.1f} "
+              f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['max_ms']:>8.1f}")
+
+
+def compare(old, new, tolerance):
+    """Print p99 ratios per route; returns the routes whose p99 grew past ``tolerance``."""
+    worse = []
+    print(f'{"route":<42} {"old p99":>9} {"new p99":>9} {"ratio":>7}')
+    for route, r in new['routes'].items():
+        o = old.get('routes', {}).get(route)
+        if not o:
+            continue
+        ratio = r['p99_ms'] / o['p99_ms'] if o['p99_ms'] else float('inf')
+        flag = '  <-- regression' if ratio > tolerance else ''
+        print(f"{route:<42} {o['p99_ms']:>9.1f} {r['p99_ms']:>9.1f} {ratio:>7.2f}{flag}")
+        if flag:
+            worse.append(route)
+    return worse
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', help='base URL of a running server (default: in-process)')
+    parser.add_argument('--data-dir', help='data directory for the in-process app '
+                                           '(default: $MOODKEEPER_DATA_DIR, else a temp dir removed afterwards)')
+    parser.add_argument('--users', type=int, default=16, help='concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=20, help='seconds to run (0: until --requests)')
+    parser.add_argument('--requests', type=int, help='stop after this many actions')
+    parser.add_argument('--mix', help=f'action weights, e.g. entry=10,dashboard=1 (default {MIX})')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=60, help='per-request timeout (seconds)')
+    parser.add_argument('--json', help='also write the report to this file')
+    parser.add_argument('--compare', help='earlier JSON report; exit 1 if a route p99 regressed')
+    parser.add_argument('--tolerance', type=float, default=1.5, help='p99 ratio counted as a regression')
+    args = parser.parse_args(argv)
+    if not args.duration and not args.requests:
+        parser.error('give --duration or --requests')
+
+    report = asyncio.run(_remote(args) if args.url else _in_process(args))
+    report.update(target=args.url or 'asgi', users=args.users, mix=parse_mix(args.mix), seed=args.seed)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            worse = compare(json.load(f), report, args.tolerance)
+        if worse:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
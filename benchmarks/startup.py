@@ -0,0 +1,96 @@
+"""
+Cold import time of app.server.
+
+Each run is a fresh interpreter, so nothing is cached in sys.modules;
+the OS page cache stays warm after the first run, which is what a
+uvicorn worker restart or a reload cycle sees too. Also reports which
+heavy analytics modules the import pulled in (none, since app/lazy.py)
+and, with --warm-up, how long lazy.warm_up() takes on top.
+
+    python benchmarks/startup.py --runs 10
+    python benchmarks/startup.py --json > startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+HEAVY = ('pandas', 'numpy', 'matplotlib', 'seaborn', 'pyarrow')
+
+_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import app.server
+t1 = time.perf_counter()
+loaded = [m for m in {heavy!r} if m in sys.modules]
+warm = None
+if {warm_up!r}:
+    from app import lazy
+    lazy.warm_up()
+    warm = time.perf_counter() - t1
+print(json.dumps({{
+    'import': t1 - t0,
+    'warm_up': warm,
+    'loaded': loaded,
+}}))
+"""
+
+
+def probe(warm_up=False):
+    """One fresh interpreter: seconds to import app.server, and what it loaded."""
+    code = _PROBE.format(warm_up=warm_up, heavy=HEAVY)
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def _stats(values):
+    return {
+        'min': min(values),
+        'median': statistics.median(values),
+        'max': max(values),
+    }
+
+
+def run(runs=5, warm_up=False):
+    # one throwaway run so every measured one sees a warm page cache
+    probe()
+    samples = [probe(warm_up) for _ in range(runs)]
+    report = {
+        'python': sys.version.split()[0],
+        'runs': runs,
+        'import_app_server': _stats([s['import'] for s in samples]),
+        'loaded_on_import': samples[-1]['loaded'],
+    }
+    if warm_up:
+        report['warm_up'] = _stats([s['warm_up'] for s in samples])
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--warm-up', action='store_true', help='also time lazy.warm_up()')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args(argv)
+
+    report = run(args.runs, args.warm_up)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    imp = report['import_app_server']
+    print(f"import app.server  min {imp['min'] * 1000:.0f} ms  "
+          f"median {imp['median'] * 1000:.0f} ms  max {imp['max'] * 1000:.0f} ms  ({args.runs} runs)")
+    print(f"analytics modules loaded by the import: {', '.join(report['loaded_on_import']) or 'none'}")
+    if 'warm_up' in report:
+        warm = report['warm_up']
+        print(f"lazy.warm_up()     median {warm['median'] * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,357 @@
+"""
+End-to-end benchmark of the storage and analytics layers.
+
+Generates seeded synthetic datasets in the real accounts.csv/entries.csv
+schema (cached, so each size is written once), then runs every size in a
+fresh interpreter pointed at it through MOODKEEPER_DATA_DIR and times:
+
+  storage     list_all, get, find_by_handle, create
+  aggregates  load (cold fold of every entry), summary, avg_by,
+              correlations, timeseries, daily_mood: what /api/insights/*
+              serves
+  insights    load (cold frame parse) and alerts, the pandas paths the
+              API still uses
+  pandas      summary, avg_by, correlations on the frame (no longer
+              served; kept to compare against the aggregates)
+  plots       plot_png for every plot/type combination, ts fed from the
+              daily rollups as the server does
+
+Each operation reports its first (cold) run, the median of the repeats,
+and the peak memory traced while it ran. The report is JSON, so runs of
+two versions can be diffed, or compared directly with --compare.
+
+    python benchmarks/suite.py --sizes 10k,100k --out report.json
+    python benchmarks/suite.py --compare before.json --out after.json
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+SIZES = ('10k', '100k', '1M', '10M')
+
+ACCOUNT_FIELDS = ['id', 'handle', 'email', 'hashed', 'created']
+ENTRY_FIELDS = ['id', 'account_id', 'handle', 'mood', 'comment', 'sleep_hours', 'appetite', 'concentration', 'created']
+
+# every plot_png variant the API can ask for
+PLOTS = (
+    ('hist', None), ('hist', 'pie'), ('hist', 'doughnut'), ('hist', 'scatter'),
+    ('by_handle', None), ('by_handle', 'pie'), ('by_handle', 'doughnut'), ('by_handle', 'scatter'),
+    ('ts', None), ('ts', 'scatter'),
+)
+
+COMMENTS = ('Un día normal', 'Me siento ok', 'Día difícil', '¡Me siento genial!', 'Necesito ayuda',
+            'Dormí poco, "otra vez"', 'Reunión larga,\ncansado')
+
+# calls per timed run of the point operations
+POINT_CALLS = 1000
+CREATE_CALLS = 100
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    scale = {'k': 10 ** 3, 'm': 10 ** 6}.get(text[-1:], 1)
+    return int(float(text.rstrip('km')) * scale)
+
+
+def size_label(n):
+    for suffix, scale in (('M', 10 ** 6), ('k', 10 ** 3)):
+        if n >= scale and n % scale == 0:
+            return f'{n // scale}{suffix}'
+    return str(n)
+
+
+# -- datasets -----------------------------------------------------------------
+
+def generate(directory, entries, handles, seed, days=365):
+    """Write accounts.csv and entries.csv for one dataset into ``directory``.
+
+    Each handle gets its own baseline mood; entries are spread evenly over
+    the last ``days`` days in id order, like the real append-only log, with
+    optional fields left blank about a fifth of the time.
+    """
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    names = [f'user{i:05d}' for i in range(handles)]
+    base = [rng.uniform(2.5, 8.5) for _ in names]
+    # one real PBKDF2 hash, shared: verifying it costs what a real one does
+    from passlib.hash import pbkdf2_sha256
+    hashed = pbkdf2_sha256.hash('password123')
+    end = datetime.now().replace(microsecond=0)
+    start = end - timedelta(days=days)
+
+    with open(os.path.join(directory, 'accounts.csv'), 'w', newline='', encoding='utf-8') as f:
+        w = csv.writer(f)
+        w.writerow(ACCOUNT_FIELDS)
+        for i, name in enumerate(names):
+            w.writerow([i + 1, name, f'{name}@example.com', hashed, (start - timedelta(days=1)).isoformat()])
+
+    step = (end - start) / max(entries, 1)
+    with open(os.path.join(directory, 'entries.csv'), 'w', newline='', encoding='utf-8') as f:
+        w = csv.writer(f)
+        w.writerow(ENTRY_FIELDS)
+        for eid in range(1, entries + 1):
+            u = rng.randrange(handles)
+            mood = min(10, max(1, round(rng.gauss(base[u], 1.8))))
+            optional = rng.random() >= 0.2
+            w.writerow([
+                eid, u + 1, names[u], mood,
+                rng.choice(COMMENTS) if rng.random() < 0.3 else '',
+                round(rng.uniform(3, 10), 1) if optional else '',
+                min(10, max(1, mood + rng.randint(-2, 2))) if optional else '',
+                min(10, max(1, mood + rng.randint(-3, 1))) if optional else '',
+                (start + step * eid).isoformat(),
+            ])
+
+
+def dataset(cache, entries, handles, seed):
+    """Directory of the cached dataset, generating it on first use."""
+    directory = os.path.join(cache, f'{size_label(entries)}-h{handles}-s{seed}')
+    done = os.path.join(directory, '.complete')
+    if not os.path.exists(done):
+        shutil.rmtree(directory, ignore_errors=True)
+        t = time.perf_counter()
+        generate(directory, entries, handles, seed)
+        open(done, 'w').close()
+        print(f'  generated {size_label(entries)} entries in {time.perf_counter() - t:.1f}s', file=sys.stderr)
+    return directory
+
+
+# -- measurements (run inside the per-size worker) -----------------------------
+
+def _measure(fn, repeat, memory):
+    times = []
+    for _ in range(max(1, repeat)):
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    result = {'first_s': times[0], 'median_s': statistics.median(times), 'runs': len(times)}
+    if memory:
+        tracemalloc.start()
+        try:
+            fn()
+            result['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def _operations(entries, handles, seed):
+    # (name, calls per run, callable); imported here so MOODKEEPER_DATA_DIR
+    # is already set when app.config reads it
+    from app import insights
+    from app.storage import AccountStore, EntryStore
+
+    rng = random.Random(seed)
+    entry_store = EntryStore()
+    account_store = AccountStore()
+    ids = [rng.randint(1, entries) for _ in range(POINT_CALLS)]
+    names = [f'user{rng.randrange(handles):05d}' for _ in range(POINT_CALLS)]
+
+    def list_all():
+        len(entry_store.list_all())
+
+    def get():
+        for i in ids:
+            entry_store.get(i)
+
+    def find_by_handle():
+        for h in names:
+            account_store.find_by_handle(h)
+
+    def create():
+        for i in range(CREATE_CALLS):
+            entry_store.create(1, 'user00000', 5, None, 7.0, 5, 5)
+
+    def load():
+        # the shared frame, parsed from scratch every run
+        with insights._FRAME_LOCK:
+            insights._FRAME_CACHE['df'] = None
+        insights._load_entries()
+
+    aggregates = entry_store.aggregates
+
+    ops = [
+        ('list_all', 1, list_all),
+        ('get', POINT_CALLS, get),
+        ('find_by_handle', POINT_CALLS, find_by_handle),
+        ('aggregates.load', 1, aggregates.rebuild),
+        ('aggregates.summary', 1, aggregates.summary),
+        ('aggregates.avg_by', 1, aggregates.avg_by),
+        ('aggregates.correlations', 1, aggregates.correlations),
+        ('aggregates.timeseries', 1, aggregates.timeseries),
+        ('aggregates.daily_mood', 1, aggregates.daily_mood),
+        ('insights.load', 1, load),
+        ('insights.alerts', 1, insights.alerts),
+        ('pandas.summary', 1, insights.summary),
+        ('pandas.avg_by', 1, insights.avg_by),
+        ('pandas.correlations', 1, insights.correlations),
+    ]
+    # ts gets its points from the daily rollups, as the plot endpoint does
+    for plot_name, plot_type in PLOTS:
+        ops.append((f'plot_png.{plot_name}.{plot_type or "default"}', 1,
+                    lambda p=plot_name, t=plot_type: insights.plot_png(
+                        p, t, series=aggregates.daily_mood() if p == 'ts' else None)))
+    # last: it appends to the dataset (the runner truncates it back afterwards)
+    ops.append(('create', CREATE_CALLS, create))
+    return ops, entry_store
+
+
+def worker(args):
+    """Time every operation against the dataset in MOODKEEPER_DATA_DIR."""
+    import resource
+    from app import lazy
+
+    # import time belongs to benchmarks/startup.py, not to the first operation
+    lazy.warm_up()
+    ops, entry_store = _operations(args.entries, args.handles, args.seed)
+    wanted = set(args.ops.split(',')) if args.ops else None
+    results = {}
+    for name, calls, fn in ops:
+        if wanted and not any(name == w or name.startswith(w + '.') for w in wanted):
+            continue
+        try:
+            r = _measure(fn, args.repeat, not args.no_memory)
+        except Exception as exc:
+            r = {'error': f'{type(exc).__name__}: {exc}'}
+        r['calls'] = calls
+        results[name] = r
+        print(f'    {name:<32} {r.get("median_s", float("nan")) * 1000:10.1f} ms', file=sys.stderr)
+    entry_store.close()
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    report = {'ops': results, 'max_rss_bytes': rss if sys.platform == 'darwin' else rss * 1024}
+    with open(args.worker_out, 'w', encoding='utf-8') as f:
+        json.dump(report, f)
+
+
+# -- runner -------------------------------------------------------------------
+
+def run_size(directory, entries, args):
+    entries_csv = os.path.join(directory, 'entries.csv')
+    size_before = os.path.getsize(entries_csv)
+    fd, out = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    env = dict(os.environ,
+               MOODKEEPER_DATA_DIR=directory,
+               MOODKEEPER_STORAGE='csv',
+               MOODKEEPER_ENTRY_TABLE='0',
+               MOODKEEPER_SNAPSHOT_INTERVAL='0',
+               PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    cmd = [sys.executable, os.path.abspath(__file__), '--worker', '--worker-out', out,
+           '--entries', str(entries), '--handles', str(args.handles), '--seed', str(args.seed),
+           '--repeat', str(args.repeat)]
+    if args.ops:
+        cmd += ['--ops', args.ops]
+    if args.no_memory:
+        cmd.append('--no-memory')
+    try:
+        subprocess.run(cmd, env=env, cwd=ROOT, check=True, timeout=args.timeout)
+        with open(out, encoding='utf-8') as f:
+            report = json.load(f)
+    except subprocess.TimeoutExpired:
+        report = {'error': f'timed out after {args.timeout}s'}
+    except subprocess.CalledProcessError as exc:
+        report = {'error': f'worker exited with {exc.returncode}'}
+    finally:
+        os.remove(out)
+        # undo the rows `create` appended and anything derived from them, so
+        # the cached dataset stays what the seed says it is
+        with open(entries_csv, 'r+b') as f:
+            f.truncate(size_before)
+        for name in os.listdir(directory):
+            if name.startswith('entries.snapshot') or name.endswith('.lock'):
+                os.remove(os.path.join(directory, name))
+    report.update(entries=entries, dataset_bytes=size_before)
+    return report
+
+
+def _git_revision():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(old, new):
+    """Print median-time ratios (new / old) for every size and operation in both."""
+    before = {r['entries']: r for r in old.get('results', [])}
+    print(f'{"size":>6}  {"operation":<32} {"old ms":>10} {"new ms":>10} {"ratio":>7}')
+    for r in new.get('results', []):
+        o = before.get(r['entries'])
+        if o is None:
+            continue
+        for name, m in r.get('ops', {}).items():
+            om = o.get('ops', {}).get(name)
+            if not om or 'median_s' not in om or 'median_s' not in m:
+                continue
+            ratio = m['median_s'] / om['median_s'] if om['median_s'] else float('inf')
+            print(f'{size_label(r["entries"]):>6}  {name:<32} {om["median_s"] * 1000:10.1f} '
+                  f'{m["median_s"] * 1000:10.1f} {ratio:7.2f}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default=','.join(SIZES), help='entry counts, e.g. 10k,100k,1M')
+    parser.add_argument('--handles', type=int, default=2000, help='distinct handles per dataset')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per operation')
+    parser.add_argument('--ops', help='only these operations (comma separated names or prefixes, e.g. insights,get)')
+    parser.add_argument('--no-memory', action='store_true', help='skip the traced peak-memory run')
+    parser.add_argument('--timeout', type=float, default=3600, help='seconds allowed per dataset size')
+    parser.add_argument('--datasets', default=os.path.join(tempfile.gettempdir(), 'moodkeeper-bench'),
+                        help='where generated datasets are cached')
+    parser.add_argument('--out', help='write the JSON report here (default: stdout)')
+    parser.add_argument('--compare', help='earlier report to compare the new one against')
+    # internal: one size, inside the per-size subprocess
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--worker-out', help=argparse.SUPPRESS)
+    parser.add_argument('--entries', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        worker(args)
+        return
+
+    report = {
+        'suite': 'moodkeeper',
+        'revision': _git_revision(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'started': datetime.now().isoformat(timespec='seconds'),
+        'handles': args.handles,
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'results': [],
+    }
+    for text in args.sizes.split(','):
+        entries = parse_size(text)
+        print(f'{size_label(entries)} entries', file=sys.stderr)
+        directory = dataset(args.datasets, entries, args.handles, args.seed)
+        report['results'].append(run_size(directory, entries, args))
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+"""
+Rewrite the columnar snapshot of data/entries.csv used by the analytics.
+The server already does this in the background every
+MOODKEEPER_SNAPSHOT_INTERVAL seconds; run it by hand after a bulk import
+or from cron when the background job is turned off.
+"""
+import sys
+
+from app import snapshot
+
+
+def compact_entries(csv_path):
+    """Bring the snapshot next to csv_path up to date."""
+    print(f"📁 Entries: {csv_path}")
+    meta = snapshot.compact(csv_path)
+    if meta is None:
+        print("ℹ️  Snapshot already up to date")
+    else:
+        print(f"✅ Snapshot: {meta['file']} ({meta['rows']} rows, {meta['format']})")
+    return True
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("MoodKeeper - Entries Snapshot")
+    print("=" * 60)
+    print()
+
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else snapshot.ENTRIES
+    success = compact_entries(csv_path)
+
+    print()
+    if success:
+        print("🎉 Compaction completed successfully!")
+    print("=" * 60)
@@ -87,19 +87,22 @@ def generate_entry(mood_category='medium'):
         'comment': comment
     }
 
-def create_entry(token, entry):
-    """Create an entry with authentication."""
+def create_entries(token, entries):
+    """Create several entries with one bulk request; returns the rejected positions."""
     try:
         headers = {'Authorization': f'Bearer {token}'}
-        res = requests.post(f'{API_BASE}/entries', json=entry, headers=headers)
-        if res.status_code == 201:
-            return True
+        res = requests.post(f'{API_BASE}/entries/bulk', json=entries, headers=headers)
+        if res.status_code == 200:
+            errors = res.json()['errors']
+            for err in errors:
+                print(f"❌ Error creando entrada {err['index']}: {err['detail']}")
+            return {err['index'] for err in errors}
         else:
-            print(f"❌ Error creando entrada: {res.text}")
-            return False
+            print(f"❌ Error creando entradas: {res.text}")
+            return set(range(len(entries)))
     except Exception as e:
-        print(f"❌ Excepción al crear entrada: {e}")
-        return False
+        print(f"❌ Excepción al crear entradas: {e}")
+        return set(range(len(entries)))
 
 def generate_sample_data():
     """Generate realistic sample data for all users."""
@@ -151,13 +154,14 @@ def generate_sample_data():
         random.shuffle(categories)
         
         print(f"\n  Generando entradas para {handle}:")
-        for i, category in enumerate(categories, 1):
-            entry = generate_entry(category)
-            if create_entry(token, entry):
-                total_entries += 1
-                mood_emoji = '😊' if entry['mood'] >= 7 else ('😐' if entry['mood'] >= 5 else '😢')
-                print(f"    [{i}/{len(categories)}] {mood_emoji} Mood: {entry['mood']}, Sleep: {entry['sleep_hours']}h, Comment: {entry['comment'][:30]}...")
-            time.sleep(0.3)
+        entries = [generate_entry(category) for category in categories]
+        rejected = create_entries(token, entries)
+        for i, entry in enumerate(entries, 1):
+            if i - 1 in rejected:
+                continue
+            total_entries += 1
+            mood_emoji = '😊' if entry['mood'] >= 7 else ('😐' if entry['mood'] >= 5 else '😢')
+            print(f"    [{i}/{len(categories)}] {mood_emoji} Mood: {entry['mood']}, Sleep: {entry['sleep_hours']}h, Comment: {entry['comment'][:30]}...")
     
     print()
     print("=" * 60)
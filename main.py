@@ -1,7 +1,58 @@
 #!/usr/bin/env python3
-"""MoodKeeper entrypoint"""
+"""MoodKeeper entrypoint
+
+    python main.py                # development: one process, auto-reload
+    python main.py --production   # MOODKEEPER_WORKERS processes, no reload
+
+Host, port, workers, keep-alive, backlog and the graceful-shutdown timeout
+come from the MOODKEEPER_* settings in app/config.py; the flags below
+override them for one run.
+"""
+import argparse
+
 from uvicorn import run
 
+from app import config, storage
+
+
+def production_options(workers=None, host=None, port=None):
+    """uvicorn.run() keyword arguments for a multi-process deployment."""
+    workers = max(1, workers or config.WORKERS)
+    if workers > 1 and config.STORAGE_BACKEND == 'csv' and not storage.FILE_LOCKS:
+        # without flock the CSV appends can't be coordinated between processes
+        print('⚠️  No file locking on this platform: running a single worker for the CSV storage')
+        workers = 1
+    return {
+        'host': host or config.HOST,
+        'port': port or config.PORT,
+        'workers': workers,
+        'timeout_keep_alive': config.KEEPALIVE,
+        'backlog': config.BACKLOG,
+        # on SIGTERM: stop accepting, give in-flight requests this long, then
+        # run the shutdown hooks (which drain the entries writer)
+        'timeout_graceful_shutdown': config.GRACEFUL_TIMEOUT,
+        'reload': False,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the MoodKeeper API')
+    parser.add_argument('--production', action='store_true', default=config.SERVER_MODE == 'production',
+                        help='several workers, no auto-reload (MOODKEEPER_SERVER_MODE=production)')
+    parser.add_argument('--workers', type=int, help='worker processes (MOODKEEPER_WORKERS)')
+    parser.add_argument('--host', help='bind address (MOODKEEPER_HOST)')
+    parser.add_argument('--port', type=int, help='port (MOODKEEPER_PORT)')
+    args = parser.parse_args(argv)
+
+    if args.production:
+        options = production_options(args.workers, args.host, args.port)
+        print(f"Starting MoodKeeper (production, {options['workers']} workers) "
+              f"on {options['host']}:{options['port']}...")
+    else:
+        options = {'host': args.host or config.HOST, 'port': args.port or config.PORT, 'reload': True}
+        print('Starting MoodKeeper...')
+    run('app.server:app', **options)
+
+
 if __name__ == '__main__':
-    print('Starting MoodKeeper...')
-    run('app.server:app', host='127.0.0.1', port=8001, reload=True)
+    main()
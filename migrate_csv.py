@@ -1,88 +1,90 @@
 """
-Migration script to add extended fields to existing entries.csv
-Adds: sleep_hours, appetite, concentration columns with empty values for existing entries.
+Schema migrations for data/entries.csv (see app/migrations.py).
+
+Streams the CSV through every pending schema step into a new file and
+swaps it in atomically. The server may keep running: entries appended
+meanwhile are carried over, and appends only wait for the final swap.
+An interrupted run resumes from its last checkpoint when started again.
+
+    python migrate_csv.py                 # migrate to the latest version
+    python migrate_csv.py --status        # show the version and pending steps
+    python migrate_csv.py --to 2 --no-backup data/entries.csv
 """
-import csv
-import os
-import shutil
-from datetime import datetime
+import argparse
 
-ROOT = os.path.abspath(os.path.dirname(__file__))
-DATA_DIR = os.path.join(ROOT, 'data')
-ENTRIES_PATH = os.path.join(DATA_DIR, 'entries.csv')
-BACKUP_PATH = os.path.join(DATA_DIR, f'entries_backup_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv')
+from app import migrations, storage
 
-def migrate_entries_csv():
-    """Migrate entries.csv to include new extended fields."""
-    
-    if not os.path.exists(ENTRIES_PATH):
-        print(f"❌ File not found: {ENTRIES_PATH}")
+
+def migrate_entries_csv(csv_path, target=None, backup=True):
+    """Migrate csv_path to schema ``target`` (default: latest)."""
+    print(f"📁 Entries: {csv_path}")
+    try:
+        steps = migrations.pending(csv_path, target)
+    except (OSError, migrations.MigrationError) as exc:
+        print(f"❌ {exc}")
         return False
-    
-    # Create backup
-    print(f"📁 Creating backup: {BACKUP_PATH}")
-    shutil.copy2(ENTRIES_PATH, BACKUP_PATH)
-    print(f"✅ Backup created successfully")
-    
-    # Read existing data
-    existing_rows = []
-    old_headers = []
-    
-    with open(ENTRIES_PATH, 'r', newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        old_headers = reader.fieldnames
-        for row in reader:
-            existing_rows.append(row)
-    
-    print(f"📊 Found {len(existing_rows)} existing entries")
-    print(f"📋 Old headers: {old_headers}")
-    
-    # Check if migration is needed
-    if 'sleep_hours' in old_headers and 'appetite' in old_headers and 'concentration' in old_headers:
-        print("✅ CSV already has extended fields. No migration needed.")
+    if not steps:
+        print(f"✅ Already at schema version {migrations.schema_version(csv_path)}. No migration needed.")
         return True
-    
-    # Define new headers
-    new_headers = ['id', 'account_id', 'handle', 'mood', 'comment', 'sleep_hours', 'appetite', 'concentration', 'created']
-    print(f"📋 New headers: {new_headers}")
-    
-    # Write migrated data
-    with open(ENTRIES_PATH, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=new_headers, extrasaction='ignore')
-        writer.writeheader()
-        
-        for row in existing_rows:
-            # Add empty values for new fields
-            row['sleep_hours'] = ''
-            row['appetite'] = ''
-            row['concentration'] = ''
-            writer.writerow(row)
-    
-    print(f"✅ Migration completed successfully!")
-    print(f"✅ Updated {len(existing_rows)} entries with new schema")
-    print(f"📁 Backup saved at: {BACKUP_PATH}")
-    
+    for step in steps:
+        print(f"📋 Step {step.version}: {step.description}")
+    if not storage.FILE_LOCKS:
+        print("⚠️  No file locks on this platform: stop the server before migrating")
+
+    result = migrations.migrate(csv_path, target, backup=backup,
+                                progress=lambda rows: print(f"   ... {rows} rows converted"))
+    if result['resumed']:
+        print("↪️  Resumed from the last checkpoint")
+    print(f"✅ Schema version {result['from']} → {result['to']}: {result['rows']} entries")
+    if result['kept']:
+        print(f"⚠️  {result['kept']} malformed rows copied unchanged")
+    print(f"⏱️  Appends paused for {result['locked_s'] * 1000:.1f} ms ({result['tail_rows']} rows appended meanwhile)")
+    if result['backup']:
+        print(f"📁 Backup saved at: {result['backup']}")
+    return True
+
+
+def show_status(csv_path):
+    try:
+        version = migrations.schema_version(csv_path)
+        steps = migrations.pending(csv_path)
+    except (OSError, migrations.MigrationError) as exc:
+        print(f"❌ {exc}")
+        return False
+    print(f"📋 {csv_path}: schema version {version} (latest {migrations.LATEST})")
+    for step in steps:
+        print(f"   pending {step.version}: {step.description}")
     return True
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='MoodKeeper - CSV schema migration')
+    parser.add_argument('csv_path', nargs='?', default=storage.ENTRIES)
+    parser.add_argument('--to', type=int, help='target schema version (default: latest)')
+    parser.add_argument('--no-backup', action='store_true', help="don't keep the old file")
+    parser.add_argument('--status', action='store_true', help='only show the current version and pending steps')
+    args = parser.parse_args()
+
     print("=" * 60)
     print("MoodKeeper - CSV Schema Migration")
     print("=" * 60)
     print()
-    
-    success = migrate_entries_csv()
-    
+
+    if args.status:
+        success = show_status(args.csv_path)
+    else:
+        success = migrate_entries_csv(args.csv_path, args.to, backup=not args.no_backup)
+
     print()
-    if success:
+    if success and not args.status:
         print("🎉 Migration completed successfully!")
         print()
         print("Next steps:")
         print("1. Verify new CSV structure")
         print("2. Test with: python main.py")
         print("3. Check Swagger: http://127.0.0.1:8001/docs")
-    else:
+    elif not success:
         print("❌ Migration failed. Check error messages above.")
-        print("💡 Your data is safe - backup created before any changes.")
-    
+        print("💡 Your data is safe - the original file is only replaced at the very end.")
+
     print("=" * 60)
@@ -0,0 +1,39 @@
+"""
+One-shot import of data/accounts.csv and data/entries.csv into SQLite.
+Run it once, then start the server with MOODKEEPER_STORAGE=sqlite.
+Ids are preserved and already-imported rows are skipped, so re-running is safe.
+"""
+import os
+import sys
+
+from app import config
+from app.sqlite_backend import import_csv
+
+
+def migrate_to_sqlite(db_path):
+    """Copy the CSV stores into the SQLite database at db_path."""
+    print(f"📁 Database: {db_path}")
+    n_accounts, n_entries = import_csv(db_path)
+    print(f"✅ Accounts imported: {n_accounts}")
+    print(f"✅ Entries imported: {n_entries}")
+    return True
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("MoodKeeper - CSV → SQLite Import")
+    print("=" * 60)
+    print()
+
+    db_path = sys.argv[1] if len(sys.argv) > 1 else config.SQLITE_PATH
+    success = migrate_to_sqlite(os.path.abspath(db_path))
+
+    print()
+    if success:
+        print("🎉 Import completed successfully!")
+        print()
+        print("Next steps:")
+        print("1. export MOODKEEPER_STORAGE=sqlite")
+        print(f"2. export MOODKEEPER_SQLITE_PATH={db_path}")
+        print("3. python main.py")
+    print("=" * 60)
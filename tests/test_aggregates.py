@@ -0,0 +1,61 @@
+"""
+RunningAggregates (app/aggregates.py) following a CSV backend.
+
+    python -m pytest -q tests
+"""
+from app.aggregates import RunningAggregates
+from app.storage import CsvEntryBackend
+
+
+def _rows(moods, handle='ana'):
+    return [(1, handle, m, None, None, None, None) for m in moods]
+
+
+def _rewrite(path, entries, keep):
+    # what a restore or a manual edit leaves: the same file, fewer or other rows
+    with open(path, 'rb') as f:
+        lines = f.readlines()
+    with open(path, 'wb') as f:
+        f.writelines(lines[:1 + keep])
+    entries.close()
+    return CsvEntryBackend(path)
+
+
+def test_appends_are_folded_in(tmp_path):
+    entries = CsvEntryBackend(str(tmp_path / 'entries.csv'))
+    agg = RunningAggregates(entries)
+    entries.create_many(_rows([2, 4]))
+    assert agg.summary()['count'] == 2
+    agg.add(entries.create(2, 'beto', 9, None))
+    entries.create_many(_rows([6]))
+    assert agg.summary()['count'] == 4
+    assert agg.avg_by() == {'beto': 9.0, 'ana': 4.0}
+    entries.close()
+
+
+def test_shrunk_source_is_folded_again(tmp_path):
+    path = str(tmp_path / 'entries.csv')
+    entries = CsvEntryBackend(path)
+    entries.create_many(_rows([1, 2, 3, 4, 5]))
+    agg = RunningAggregates(entries)
+    assert agg.summary()['count'] == 5
+
+    agg.backend = entries = _rewrite(path, entries, 2)
+    assert agg.summary()['count'] == 2
+    assert agg.avg_by() == {'ana': 1.5}
+    entries.close()
+
+
+def test_rewritten_source_is_folded_again(tmp_path):
+    path = str(tmp_path / 'entries.csv')
+    entries = CsvEntryBackend(path)
+    entries.create_many(_rows([1, 2, 3]))
+    agg = RunningAggregates(entries)
+    assert agg.avg_by() == {'ana': 2.0}
+
+    # same ids, other rows: the last one we folded is gone
+    agg.backend = entries = _rewrite(path, entries, 0)
+    entries.create_many(_rows([10, 10, 10, 10], handle='beto'))
+    assert agg.summary()['count'] == 4
+    assert agg.avg_by() == {'beto': 10.0}
+    entries.close()
@@ -0,0 +1,146 @@
+"""
+Contract tests for the storage backends: the CSV and SQLite
+implementations of AccountBackend/EntryBackend must behave the same.
+
+    python -m pytest -q tests
+"""
+from datetime import timedelta
+
+import pytest
+
+from app.sqlite_backend import SqliteAccountBackend, SqliteEntryBackend, import_csv
+from app.storage import CsvAccountBackend, CsvEntryBackend
+
+
+def _csv(tmp_path):
+    return CsvAccountBackend(str(tmp_path / 'accounts.csv')), CsvEntryBackend(str(tmp_path / 'entries.csv'))
+
+
+def _sqlite(tmp_path):
+    db = str(tmp_path / 'moodkeeper.db')
+    return SqliteAccountBackend(db), SqliteEntryBackend(db)
+
+
+@pytest.fixture(params=[_csv, _sqlite], ids=['csv', 'sqlite'])
+def backends(request, tmp_path):
+    accounts, entries = request.param(tmp_path)
+    yield accounts, entries
+    entries.close()
+
+
+@pytest.fixture
+def accounts(backends):
+    return backends[0]
+
+
+@pytest.fixture
+def entries(backends):
+    return backends[1]
+
+
+def _row(account_id=1, handle='ana', mood=5, comment=None, sleep_hours=None, appetite=None, concentration=None):
+    return (account_id, handle, mood, comment, sleep_hours, appetite, concentration)
+
+
+# accounts
+
+def test_account_create_and_find(accounts):
+    a = accounts.create('ana', 'ana@example.com', 'hash-a')
+    assert a.id >= 1
+    assert (a.handle, a.email, a.hashed) == ('ana', 'ana@example.com', 'hash-a')
+    assert accounts.find_by_handle('ana') == a
+    assert accounts.find_by_handle('nadie') is None
+
+
+def test_account_ids_increase_and_first_handle_wins(accounts):
+    a = accounts.create('ana', 'ana@example.com', 'h1')
+    b = accounts.create('beto', 'beto@example.com', 'h2')
+    accounts.create('ana', 'otra@example.com', 'h3')
+    assert b.id > a.id
+    assert accounts.find_by_handle('ana').id == a.id
+    assert [x.handle for x in accounts.iter_all()] == ['ana', 'beto', 'ana']
+
+
+def test_account_version_changes_on_create(accounts):
+    before = accounts.version()
+    accounts.create('ana', 'ana@example.com', 'h')
+    assert accounts.version() != before
+
+
+# entries
+
+def test_entry_create_and_get_many(entries):
+    e1 = entries.create(1, 'ana', 7, 'Me siento bien', 7.5, 8, 9)
+    e2 = entries.create(2, 'beto', 3, None)
+    assert e2.id > e1.id
+    assert (e1.mood, e1.comment, e1.sleep_hours, e1.appetite, e1.concentration) == (7, 'Me siento bien', 7.5, 8, 9)
+    assert e2.comment is None and e2.sleep_hours is None and e2.appetite is None and e2.concentration is None
+    got = entries.get_many([e2.id, 999, e1.id])
+    assert got == [e2, None, e1]
+
+
+def test_entry_list_all_in_id_order(entries):
+    created = [entries.create(1, 'ana', m, None) for m in (1, 5, 10)]
+    assert entries.list_all() == created
+
+
+def test_create_many_gets_contiguous_ids(entries):
+    first = entries.create(1, 'ana', 5, None)
+    batch = entries.create_many([_row(mood=m) for m in range(1, 8)])
+    assert [e.id for e in batch] == list(range(first.id + 1, first.id + 8))
+    assert [e.mood for e in batch] == list(range(1, 8))
+    assert entries.create_many([]) == []
+    assert entries.list_all() == [first] + batch
+
+
+def test_iter_entries_after_id_and_limit(entries):
+    created = entries.create_many([_row(mood=m) for m in range(1, 11)])
+    ids = [e.id for e in created]
+    assert [e.id for e in entries.iter_entries()] == ids
+    assert [e.id for e in entries.iter_entries(after_id=ids[3])] == ids[4:]
+    assert [e.id for e in entries.iter_entries(after_id=ids[3], limit=2)] == ids[4:6]
+    assert list(entries.iter_entries(after_id=ids[-1])) == []
+    assert list(entries.iter_entries(limit=0)) == []
+
+
+def test_iter_entries_filters(entries):
+    created = entries.create_many([_row(1, 'ana', 5), _row(2, 'beto', 6), _row(1, 'ana', 7)])
+    later = entries.create(2, 'beto', 8, None)
+    assert [e.mood for e in entries.iter_entries(handle='ana')] == [5, 7]
+    assert [e.mood for e in entries.iter_entries(account_id=2)] == [6, 8]
+    assert list(entries.iter_entries(handle='nadie')) == []
+    # created bounds are inclusive
+    assert [e.id for e in entries.iter_entries(created_from=later.created)] == [later.id]
+    assert [e.id for e in entries.iter_entries(created_to=created[0].created)] == [e.id for e in created]
+    window = entries.iter_entries(created_from=created[0].created - timedelta(seconds=1), created_to=later.created,
+                                  handle='beto')
+    assert [e.mood for e in window] == [6, 8]
+
+
+def test_entry_version_changes_on_write(entries):
+    v0 = entries.version()
+    entries.create(1, 'ana', 5, None)
+    v1 = entries.version()
+    assert v1 != v0
+    assert entries.version() == v1
+    entries.create_many([_row(), _row()])
+    assert entries.version() != v1
+
+
+# CSV -> SQLite
+
+def test_import_csv_round_trip(tmp_path):
+    accounts_csv, entries_csv = str(tmp_path / 'accounts.csv'), str(tmp_path / 'entries.csv')
+    csv_accounts, csv_entries = CsvAccountBackend(accounts_csv), CsvEntryBackend(entries_csv)
+    csv_accounts.create('ana', 'ana@example.com', 'h1')
+    csv_accounts.create('beto', 'beto@example.com', 'h2')
+    csv_entries.create(1, 'ana', 7, 'Día "normal", con comas', 7.5, 8, None)
+    csv_entries.create_many([_row(2, 'beto', m, comment='línea\nnueva') for m in (2, 3, 4)])
+    csv_entries.close()
+
+    db = str(tmp_path / 'moodkeeper.db')
+    assert import_csv(db, accounts_csv, entries_csv) == (2, 4)
+    # re-running skips what is already there
+    assert import_csv(db, accounts_csv, entries_csv) == (0, 0)
+    assert list(SqliteAccountBackend(db).iter_all()) == list(csv_accounts.iter_all())
+    assert SqliteEntryBackend(db).list_all() == csv_entries.list_all()
@@ -0,0 +1,51 @@
+"""
+The mapped entry table (app/entry_table.py) against a CSV backend.
+
+    python -m pytest -q tests
+"""
+from app.entry_table import EntryTable
+from app.storage import CsvEntryBackend
+
+
+def _fill(entries, n):
+    return entries.create_many([(1 + i % 3, f'user{i % 3}', i % 10 + 1, f'comment {i}', None, None, None)
+                                for i in range(n)])
+
+
+def test_rows_follow_the_backend(tmp_path):
+    entries = CsvEntryBackend(str(tmp_path / 'entries.csv'))
+    table = EntryTable(entries, str(tmp_path / 'table'))
+    created = _fill(entries, 50)
+    assert [r.id for r in table.rows()] == [e.id for e in created]
+    more = _fill(entries, 5)
+    rows = table.rows()
+    assert len(rows) == 55
+    assert (rows[-1].id, rows[-1].handle, rows[-1].comment) == (more[-1].id, more[-1].handle, more[-1].comment)
+    assert [r.id for r in table.query(handle='user1')] == [e.id for e in created + more if e.handle == 'user1']
+    entries.close()
+
+
+def test_old_rows_survive_a_rebuild(tmp_path):
+    # a rebuild must not shrink files an old snapshot still maps (SIGBUS)
+    path = str(tmp_path / 'entries.csv')
+    entries = CsvEntryBackend(path)
+    table = EntryTable(entries, str(tmp_path / 'table'))
+    created = _fill(entries, 2000)
+    rows = table.rows()
+
+    # rewrite the source with 10 different rows: the table starts over
+    with open(path, 'rb') as f:
+        header = f.readline()
+    with open(path, 'wb') as f:
+        f.write(header)
+    entries.close()
+    entries = CsvEntryBackend(path)
+    table.backend = entries
+    fresh = entries.create_many([(9, 'otra', 3, f'nuevo {i}', None, None, None) for i in range(10)])
+    new_rows = table.rows()
+
+    assert [r.comment for r in new_rows] == [e.comment for e in fresh]
+    assert rows[1500].comment == created[1500].comment
+    assert rows[1999].handle == created[1999].handle
+    assert len(rows) == 2000
+    entries.close()
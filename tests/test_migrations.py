@@ -0,0 +1,103 @@
+"""
+entries.csv schema migrations (app/migrations.py), including resuming
+an interrupted run.
+
+    python -m pytest -q tests
+"""
+import csv
+import sys
+
+import pytest
+
+from app import migrations
+
+V1_ROWS = [
+    [1, 1, 'ana', 7, '', '2024-01-01T08:00:00'],
+    [2, 2, 'beto', 3, 'línea\nnueva "citada"', '2024-01-01T09:00:00'],
+    [3, 1, 'ana', 5, 'a,b', '2024-01-02T08:00:00'],
+    [4, 2, 'beto', 9, 'hola', '2024-01-02T09:00:00'],
+    [5, 1, 'ana', 6, '', '2024-01-03T08:00:00'],
+    [6, 2, 'beto', 2, '', '2024-01-03T09:00:00'],
+    [7, 1, 'ana', 8, 'bien', '2024-01-04T08:00:00'],
+]
+
+
+def _make_v1(path):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        w = csv.writer(f)
+        w.writerow(migrations.BASE_COLUMNS)
+        w.writerows(V1_ROWS)
+        # malformed: copied unchanged
+        f.write('garbage,row\r\n')
+
+
+def _expected(tmp_path):
+    path = str(tmp_path / 'full.csv')
+    _make_v1(path)
+    migrations.migrate(path, backup=False)
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_migrate_to_latest(tmp_path):
+    path = str(tmp_path / 'entries.csv')
+    _make_v1(path)
+    assert migrations.schema_version(path) == 1
+    result = migrations.migrate(path, backup=False)
+    assert (result['from'], result['to'], result['rows'], result['kept']) == (1, migrations.LATEST, 7, 1)
+    assert migrations.schema_version(path) == migrations.LATEST
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = list(csv.reader(f))
+    assert tuple(rows[0]) == migrations.columns(migrations.LATEST)
+    assert [r[0] for r in rows[1:-1]] == [str(r[0]) for r in V1_ROWS]
+    assert rows[2][4] == 'línea\nnueva "citada"'
+    assert migrations.migrate(path) is None
+
+
+def _interrupt_at(k):
+    # raise KeyboardInterrupt before the k-th line migrate() runs in its
+    # copy phase, as a Ctrl-C between any two statements would
+    seen = [0]
+
+    def local(frame, event, arg):
+        if event == 'line' and 'ids' not in frame.f_locals:
+            seen[0] += 1
+            if seen[0] == k:
+                raise KeyboardInterrupt
+        return local
+
+    def trace(frame, event, arg):
+        return local if frame.f_code is migrations.migrate.__code__ else None
+
+    return trace
+
+
+def test_resume_after_interrupt_anywhere_in_the_copy(tmp_path):
+    expected = _expected(tmp_path)
+    path = str(tmp_path / 'entries.csv')
+    k = 0
+    while True:
+        k += 1
+        _make_v1(path)
+        sys.settrace(_interrupt_at(k))
+        try:
+            migrations.migrate(path, backup=False, checkpoint_rows=2)
+        except KeyboardInterrupt:
+            pass
+        else:
+            break
+        finally:
+            sys.settrace(None)
+        result = migrations.migrate(path, backup=False, checkpoint_rows=2)
+        with open(path, 'rb') as f:
+            assert f.read() == expected, f'interrupted at line event {k}'
+        assert (result['rows'], result['kept']) == (7, 1)
+    assert k > 20
+
+
+def test_no_downgrades(tmp_path):
+    path = str(tmp_path / 'entries.csv')
+    _make_v1(path)
+    migrations.migrate(path, backup=False)
+    with pytest.raises(migrations.MigrationError):
+        migrations.migrate(path, target=1)